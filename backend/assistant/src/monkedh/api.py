@@ -5,9 +5,12 @@ Provides endpoints for chat, conversation history, and health checks
 import os
 import uuid
 import json
+import hashlib
 import base64
 import asyncio
 import struct
+import time
+import atexit
 import logging
 from typing import Optional, List, Union
 from datetime import datetime
@@ -28,12 +31,14 @@ from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 import uvicorn
+import aiofiles
 import tempfile
 import shutil
 import json
 
 from monkedh.crew import Monkedh
 from monkedh.tools.redis_storage import redis_memory
+from monkedh.tools.image_suggestion import warm_retriever
 
 # Video Report Module
 try:
@@ -41,10 +46,12 @@ try:
         VideoReportCrew,
         extract_frames,
         get_video_info,
+        skip_similar_frames,
         analyze_video_audio,
-        generate_report,
+        generate_report_async,
         markdown_to_html,
-        EmailSender
+        EmailSender,
+        PipelineState
     )
     VIDEO_REPORT_AVAILABLE = True
 except ImportError as e:
@@ -159,6 +166,10 @@ class EmailReportRequest(BaseModel):
 # Video analysis tasks storage (in-memory for now, can be moved to Redis)
 video_analysis_tasks: dict = {}
 
+# Uploaded videos left behind longer than this are considered abandoned
+UPLOAD_MAX_AGE_SECONDS = 24 * 60 * 60
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
 
 # ============================================
 # Global State
@@ -175,8 +186,18 @@ async def lifespan(app: FastAPI):
     print("🚀 Initializing Emergency First Aid Assistant API...")
     crew_factory = Monkedh()
     print("✅ CrewAI Medical Assistant initialized")
+    try:
+        app.state.clip_retriever = await asyncio.to_thread(warm_retriever)
+        print("✅ CLIP image retriever warmed up")
+    except Exception as e:
+        app.state.clip_retriever = None
+        print(f"⚠️ CLIP image retriever warm-up failed: {e}")
+    app.state.upload_dir = Path(tempfile.mkdtemp(prefix="monkedh_uploads_"))
+    # Fallback in case the process exits without running the shutdown phase
+    atexit.register(shutil.rmtree, app.state.upload_dir, ignore_errors=True)
     yield
     print("👋 Shutting down API...")
+    shutil.rmtree(app.state.upload_dir, ignore_errors=True)
 
 
 # ============================================
@@ -1290,6 +1311,18 @@ async def voice_websocket(websocket: WebSocket, session_id: str):
 # Video Report Endpoints
 # ============================================
 
+def _read_rendered_hash(report_id: str) -> Optional[str]:
+    """Return the markdown hash recorded when the report HTML was last rendered"""
+    metadata_path = VIDEO_REPORT_REPORTS_PATH / f"{report_id}_metadata.json"
+    if not metadata_path.exists():
+        return None
+    try:
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("md_hash")
+    except (OSError, ValueError):
+        return None
+
+
 async def run_video_analysis(
     report_id: str,
     video_path: str,
@@ -1309,11 +1342,23 @@ async def run_video_analysis(
         frames_dir = str(VIDEO_REPORT_FRAMES_PATH / report_id)
         os.makedirs(frames_dir, exist_ok=True)
         frames = extract_frames(video_path, every_n_seconds=2.0, output_dir=frames_dir)
+        frames = skip_similar_frames(frames)
         video_analysis_tasks[report_id]["status"] = "analyzing_frames"
         
-        # Analyze audio
+        # Analyze audio (skipped when the container has no audio track)
         video_analysis_tasks[report_id]["status"] = "analyzing_audio"
-        audio_result = analyze_video_audio(video_path)
+        # Reuse the audio analysis of an earlier run on the same video
+        video_sha256 = video_analysis_tasks[report_id].get("video_sha256")
+        pipeline_state = PipelineState.load(video_sha256) if video_sha256 else None
+        if video_info.get("has_audio") is False:
+            audio_result = None
+        elif pipeline_state is not None and pipeline_state.has_audio_result(language):
+            logger.info("Reusing audio analysis from a previous run")
+            audio_result = pipeline_state.audio_results[language]
+        else:
+            audio_result = analyze_video_audio(video_path, language=language)
+            if pipeline_state is not None:
+                pipeline_state.set_audio_result(language, audio_result)
         
         # Generate report directly (skip CrewAI for now due to configuration issues)
         video_analysis_tasks[report_id]["status"] = "generating_report"
@@ -1326,16 +1371,17 @@ async def run_video_analysis(
             logger.info("Generating manual report...")
             
             # Build frame descriptions
-            frame_descriptions = []
-            for frame_path in frames:
-                frame_descriptions.append({
+            frame_descriptions = [
+                {
                     "frame_path": frame_path,
-                    "timestamp": Path(frame_path).stem.split("_t")[-1].replace("s", "") if "_t" in frame_path else "0",
+                    "timestamp": timestamp,
                     "description": "Frame extrait de la vidéo d'urgence"
-                })
+                }
+                for frame_path, timestamp, _ in frames
+            ]
             
-            # Generate report (returns tuple of (md_path, html_path))
-            md_path, html_path = generate_report(
+            # Generate report off the event loop (returns tuple of (md_path, html_path))
+            md_path, html_path = await generate_report_async(
                 frame_descriptions=frame_descriptions,
                 audio_results=audio_result,
                 vision_client=None,
@@ -1352,25 +1398,37 @@ async def run_video_analysis(
             if report_path.exists():
                 report_path.rename(new_md_path)
                 report_path = new_md_path
-            if Path(html_path).exists():
+            if html_path and Path(html_path).exists():
                 Path(html_path).rename(new_html_path)
                 html_path = new_html_path
                 
             with open(report_path, "r", encoding="utf-8") as f:
                 report_content = f.read()
+            md_hash = hashlib.md5(report_content.encode("utf-8")).hexdigest()
+            
+            # generate_report's HTML is a full templated document; the stored
+            # report HTML is always the _render_html_report fragment
+            rendered_hash = None
             
             logger.info(f"Manual report generated: {report_path}")
         else:
             report_path = report_files[0]
             with open(report_path, "r", encoding="utf-8") as f:
                 report_content = f.read()
+            md_hash = hashlib.md5(report_content.encode("utf-8")).hexdigest()
+            rendered_hash = _read_rendered_hash(report_id)
             logger.info(f"Using CrewAI generated report: {report_path}")
         
-        # Convert to HTML
-        html_content = markdown_to_html(report_content)
+        # Convert to HTML only if the file on disk is missing or stale
         html_path = VIDEO_REPORT_REPORTS_PATH / f"{report_id}_report.html"
-        with open(html_path, "w", encoding="utf-8") as f:
-            f.write(html_content)
+        html_content = None
+        if not html_path.exists() or rendered_hash != md_hash:
+            html_content = await asyncio.to_thread(_render_html_report, report_content, html_path)
+        else:
+            logger.info(f"HTML report up to date, skipping render: {html_path}")
+        
+        if pipeline_state is not None:
+            pipeline_state.set_report(report_path, html_path)
         
         # Save metadata
         metadata = {
@@ -1381,7 +1439,9 @@ async def run_video_analysis(
             "video_info": video_info,
             "audio_analysis": audio_result,
             "report_path": str(report_path),
-            "html_path": str(html_path)
+            "html_path": str(html_path),
+            "md_hash": md_hash,
+            "video_sha256": video_analysis_tasks[report_id].get("video_sha256")
         }
         metadata_path = VIDEO_REPORT_REPORTS_PATH / f"{report_id}_metadata.json"
         with open(metadata_path, "w", encoding="utf-8") as f:
@@ -1393,6 +1453,9 @@ async def run_video_analysis(
         # Send email if requested
         if send_email and email:
             try:
+                if html_content is None:
+                    with open(html_path, "r", encoding="utf-8") as f:
+                        html_content = f.read()
                 sender = EmailSender()
                 sender.send_report(
                     to_email=email,
@@ -1417,6 +1480,25 @@ async def run_video_analysis(
         video_analysis_tasks[report_id]["error"] = str(e)
 
 
+def _render_html_report(report_content: str, html_path: Path) -> str:
+    """Render a markdown report and write the HTML file (blocking, run in a thread)"""
+    html_content = markdown_to_html(report_content)
+    with open(html_path, "w", encoding="utf-8") as f:
+        f.write(html_content)
+    return html_content
+
+
+def _sweep_stale_uploads(upload_dir: Path) -> None:
+    """Remove uploads older than UPLOAD_MAX_AGE_SECONDS (e.g. from crashed analyses)"""
+    cutoff = time.time() - UPLOAD_MAX_AGE_SECONDS
+    for entry in upload_dir.iterdir():
+        try:
+            if entry.stat().st_mtime < cutoff:
+                entry.unlink()
+        except OSError:
+            pass
+
+
 @app.post("/api/video/analyze", response_model=VideoAnalysisResponse, tags=["Video Report"])
 async def analyze_video_endpoint(
     background_tasks: BackgroundTasks,
@@ -1450,13 +1532,18 @@ async def analyze_video_endpoint(
     # Generate report ID
     report_id = f"report_{uuid.uuid4().hex[:12]}"
     
-    # Save uploaded file temporarily
-    temp_dir = tempfile.mkdtemp()
-    video_path = os.path.join(temp_dir, file.filename or "video.mp4")
+    # Save uploaded file in the shared upload directory
+    _sweep_stale_uploads(app.state.upload_dir)
+    video_path = str(app.state.upload_dir / f"{report_id}_{Path(file.filename or 'video.mp4').name}")
     
+    # Stream the upload in chunks without blocking the event loop; hash the
+    # bytes on the way through so identical videos can be recognized later
+    sha256 = hashlib.sha256()
     try:
-        with open(video_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        async with aiofiles.open(video_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                sha256.update(chunk)
+                await buffer.write(chunk)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -1467,7 +1554,8 @@ async def analyze_video_endpoint(
     video_analysis_tasks[report_id] = {
         "status": "queued",
         "created_at": datetime.now().isoformat(),
-        "filename": file.filename
+        "filename": file.filename,
+        "video_sha256": sha256.hexdigest()
     }
     
     # Start background analysis
@@ -1511,8 +1599,8 @@ async def list_video_reports():
     # Scan for metadata files
     for metadata_file in VIDEO_REPORT_REPORTS_PATH.glob("*_metadata.json"):
         try:
-            with open(metadata_file, "r", encoding="utf-8") as f:
-                metadata = json.load(f)
+            async with aiofiles.open(metadata_file, "r", encoding="utf-8") as f:
+                metadata = json.loads(await f.read())
             
             # Get thumbnail if exists
             report_id = metadata.get("id", "")
@@ -1578,8 +1666,8 @@ async def get_video_report(report_id: str):
         raise HTTPException(status_code=404, detail="Rapport non trouvé")
     
     try:
-        with open(metadata_path, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
+        async with aiofiles.open(metadata_path, "r", encoding="utf-8") as f:
+            metadata = json.loads(await f.read())
         
         # Read report content
         report_path = Path(metadata.get("report_path", ""))
@@ -1589,14 +1677,14 @@ async def get_video_report(report_id: str):
         content_html = ""
         
         if report_path.exists():
-            with open(report_path, "r", encoding="utf-8") as f:
-                content_markdown = f.read()
+            async with aiofiles.open(report_path, "r", encoding="utf-8") as f:
+                content_markdown = await f.read()
         
         if content_markdown:
             content_html = markdown_to_html(content_markdown, full_html=False) if VIDEO_REPORT_AVAILABLE else content_markdown
         elif html_path.exists():
-            with open(html_path, "r", encoding="utf-8") as f:
-                content_html = f.read()
+            async with aiofiles.open(html_path, "r", encoding="utf-8") as f:
+                content_html = await f.read()
                 # Simple strip for full HTML documents if they were saved previously
                 if "<body" in content_html:
                     try:
@@ -1637,19 +1725,19 @@ async def delete_video_report(report_id: str):
     # Delete metadata
     metadata_path = VIDEO_REPORT_REPORTS_PATH / f"{report_id}_metadata.json"
     if metadata_path.exists():
-        os.remove(metadata_path)
+        await asyncio.to_thread(os.remove, metadata_path)
         deleted_files.append(str(metadata_path))
     
     # Delete report files
     for ext in [".md", ".html"]:
         for report_file in VIDEO_REPORT_REPORTS_PATH.glob(f"{report_id}*{ext}"):
-            os.remove(report_file)
+            await asyncio.to_thread(os.remove, report_file)
             deleted_files.append(str(report_file))
     
     # Delete frames directory
     frames_dir = VIDEO_REPORT_FRAMES_PATH / report_id
     if frames_dir.exists():
-        shutil.rmtree(frames_dir)
+        await asyncio.to_thread(shutil.rmtree, frames_dir)
         deleted_files.append(str(frames_dir))
     
     # Remove from in-memory tasks
@@ -1673,8 +1761,8 @@ async def email_video_report(report_id: str, request: EmailReportRequest):
         raise HTTPException(status_code=404, detail="Rapport non trouvé")
     
     try:
-        with open(metadata_path, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
+        async with aiofiles.open(metadata_path, "r", encoding="utf-8") as f:
+            metadata = json.loads(await f.read())
         
         html_path = Path(metadata.get("html_path", ""))
         report_path = Path(metadata.get("report_path", ""))
@@ -1683,12 +1771,12 @@ async def email_video_report(report_id: str, request: EmailReportRequest):
         markdown_content = ""
         
         if html_path.exists():
-            with open(html_path, "r", encoding="utf-8") as f:
-                html_content = f.read()
+            async with aiofiles.open(html_path, "r", encoding="utf-8") as f:
+                html_content = await f.read()
         
         if report_path.exists():
-            with open(report_path, "r", encoding="utf-8") as f:
-                markdown_content = f.read()
+            async with aiofiles.open(report_path, "r", encoding="utf-8") as f:
+                markdown_content = await f.read()
         
         sender = EmailSender()
         sender.send_report(
@@ -2,10 +2,18 @@ import torch
 import clip
 import json
 import os
+import functools
 from PIL import Image
 import numpy as np
 from pathlib import Path
 
+# Optional SIMD similarity search backend
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
 class EmergencyImageRetriever:
     def __init__(self, metadata_path=None, embeddings_path=None):
         """Initialize CLIP model and load image metadata"""
@@ -20,6 +28,8 @@ class EmergencyImageRetriever:
         print("🔧 Chargement du modèle CLIP...")
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.model, self.preprocess = clip.load("ViT-B/32", device=self.device)
+        # Per-instance query cache, freed with the retriever and its model
+        self._encode_query = functools.lru_cache(maxsize=512)(self._encode_query_uncached)
         
         print("📚 Chargement des métadonnées images...")
         with open(metadata_path, 'r', encoding='utf-8') as f:
@@ -30,6 +40,11 @@ class EmergencyImageRetriever:
             if not os.path.isabs(img['filename']):
                 img['filename'] = str(current_dir / img['filename'])
         
+        # Index metadata by category once so category browsing is a dict lookup
+        self._by_category = {}
+        for idx, img in enumerate(self.metadata):
+            self._by_category.setdefault(img['category'].lower(), []).append(idx)
+        
         self.embeddings_path = str(embeddings_path)
         self.image_embeddings = None
         self.valid_indices = []  # Track which metadata indices have valid embeddings
@@ -41,6 +56,31 @@ class EmergencyImageRetriever:
         else:
             print("🎨 Calcul des embeddings images (première utilisation)...")
             self._compute_embeddings()
+        
+        self._index = self._build_index()
+    
+    def _build_index(self):
+        """Build an exact inner-product FAISS index over the normalized embeddings"""
+        if not FAISS_AVAILABLE or self.image_embeddings is None:
+            return None
+        
+        embeddings = np.ascontiguousarray(self.image_embeddings, dtype=np.float32)
+        index = faiss.IndexFlatIP(embeddings.shape[1])
+        index.add(embeddings)
+        return index
+    
+    def _similarities(self, query_embedding):
+        """Cosine similarity of the query against every image embedding"""
+        if self._index is None:
+            return (self.image_embeddings @ query_embedding.T).squeeze(-1)
+        
+        # Keyword boosting re-ranks every image, so ask FAISS for all scores
+        # and scatter them back into embedding order
+        n = self._index.ntotal
+        scores, ids = self._index.search(np.ascontiguousarray(query_embedding, dtype=np.float32), n)
+        similarities = np.empty(n, dtype=np.float32)
+        similarities[ids[0]] = scores[0]
+        return similarities
     
     def _compute_embeddings(self):
         """Compute CLIP embeddings for all images in metadata"""
@@ -60,7 +100,7 @@ class EmergencyImageRetriever:
                 image_input = self.preprocess(image).unsqueeze(0).to(self.device)
                 
                 # Compute embedding
-                with torch.no_grad():
+                with torch.inference_mode():
                     embedding = self.model.encode_image(image_input)
                     embedding = embedding / embedding.norm(dim=-1, keepdim=True)  # Normalize
                 
@@ -92,6 +132,18 @@ class EmergencyImageRetriever:
         
         print(f"✅ {len(self.image_embeddings)} embeddings chargés")
     
+    def _encode_query_uncached(self, query):
+        """Encode and normalize a query with CLIP (see _encode_query for the cache)"""
+        text_tokens = clip.tokenize([query]).to(self.device)
+        with torch.inference_mode():
+            query_embedding = self.model.encode_text(text_tokens)
+            query_embedding = query_embedding / query_embedding.norm(dim=-1, keepdim=True)
+        
+        query_embedding = query_embedding.cpu().numpy()
+        # Cached arrays are shared between calls, keep them immutable
+        query_embedding.setflags(write=False)
+        return query_embedding
+    
     def retrieve(self, query, top_k=3):
         """
         Retrieve top-k most relevant images for a query (French or English)
@@ -103,16 +155,9 @@ class EmergencyImageRetriever:
         Returns:
             list: Top-k results with metadata and similarity scores
         """
-        # Enhance query with metadata for better matching
-        enhanced_query = f"{query}"
-        
-        # Encode query text
-        text_tokens = clip.tokenize([enhanced_query]).to(self.device)
-        with torch.no_grad():
-            query_embedding = self.model.encode_text(text_tokens)
-            query_embedding = query_embedding / query_embedding.norm(dim=-1, keepdim=True)
-        
-        query_embedding = query_embedding.cpu().numpy()
+        # Encode query text (CLIP lower-cases and strips internally, so the
+        # normalized string is a safe cache key)
+        query_embedding = self._encode_query(query.strip().lower())
         
         # Keywords for boosting (French + English)
         keywords_to_boost = [
@@ -131,7 +176,7 @@ class EmergencyImageRetriever:
         query_lower = query.lower()
         
         # Compute cosine similarities
-        similarities = (self.image_embeddings @ query_embedding.T).squeeze()
+        similarities = self._similarities(query_embedding)
         
         # Apply keyword boosting - iterate over VALID indices only
         boosted_similarities = similarities.copy()
@@ -212,7 +257,9 @@ class EmergencyImageRetriever:
             boosted_similarities[emb_idx] += boost_factor
         
         # Get top-k indices (these are embedding indices, need to map back to metadata)
-        top_emb_indices = np.argsort(boosted_similarities)[::-1][:top_k]
+        top_k = min(top_k, len(boosted_similarities))
+        top_emb_indices = np.argpartition(-boosted_similarities, top_k - 1)[:top_k]
+        top_emb_indices = top_emb_indices[np.argsort(-boosted_similarities[top_emb_indices])]
         
         # Prepare results - map embedding indices back to metadata indices
         results = []
@@ -231,7 +278,7 @@ class EmergencyImageRetriever:
     
     def search_by_category(self, category):
         """Get all images in a specific category"""
-        return [img for img in self.metadata if img['category'].lower() == category.lower()]
+        return [self.metadata[idx] for idx in self._by_category.get(category.lower(), [])]
 
 
 if __name__ == "__main__":
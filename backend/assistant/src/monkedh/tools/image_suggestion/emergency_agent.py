@@ -1,17 +1,30 @@
+import threading
+
 from crewai.tools import tool
 from .clip_retriever import EmergencyImageRetriever
 
 # Initialize CLIP retriever (singleton for efficiency)
 _retriever = None
+_retriever_lock = threading.Lock()
 
 def get_retriever():
-    """Get or initialize the CLIP retriever singleton"""
+    """Get or initialize the CLIP retriever singleton (thread-safe)"""
     global _retriever
     if _retriever is None:
-        _retriever = EmergencyImageRetriever()
+        with _retriever_lock:
+            # Re-check: another tool call may have loaded CLIP while we waited
+            if _retriever is None:
+                _retriever = EmergencyImageRetriever()
     return _retriever
 
 
+def warm_retriever():
+    """Load CLIP and run a dummy query so the first user request is not a cold start"""
+    retriever = get_retriever()
+    retriever.retrieve("cpr", top_k=1)
+    return retriever
+
+
 @tool("Search Emergency Image Database")
 def search_emergency_image(query: str) -> str:
     """
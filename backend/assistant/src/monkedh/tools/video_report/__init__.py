@@ -11,15 +11,16 @@ This module provides video incident analysis capabilities including:
 Integrated with CrewAI for multi-agent orchestration.
 """
 
-from .frame_extractor import extract_frames, get_video_info
-from .vision_client import VisionClient
-from .vision_analyzer import analyze_frame, VISION_PROMPT
-from .audio_analyzer import analyze_video_audio, format_audio_summary, extract_audio_from_video
+from .frame_extractor import extract_frames, get_video_info, skip_similar_frames, iter_frames
+from .vision_client import VisionClient, get_vision_client
+from .vision_analyzer import analyze_frame, analyze_video_stream, VISION_PROMPT
+from .audio_analyzer import analyze_video_audio, format_audio_summary, extract_audio_from_video, extract_audio_pcm, has_audio_stream
 from .audio_classifier import SimpleAudioClassifier
 from .emotion_analyzer import SimpleEmotionAnalyzer
-from .report_generator import generate_report, summarize_report
+from .report_generator import generate_report, generate_report_async, summarize_report
 from .report_formatter import markdown_to_html
 from .email_sender import EmailSender
+from .pipeline_state import PipelineState, video_fingerprint
 from .crew import VideoReportCrew
 from .tools import (
     FrameExtractionTool,
@@ -32,16 +33,25 @@ __all__ = [
     # Core functions
     "extract_frames",
     "get_video_info",
+    "skip_similar_frames",
+    "iter_frames",
     "VisionClient",
+    "get_vision_client",
     "analyze_frame",
+    "analyze_video_stream",
     "VISION_PROMPT",
     "analyze_video_audio",
     "format_audio_summary",
     "extract_audio_from_video",
+    "extract_audio_pcm",
+    "has_audio_stream",
     "generate_report",
+    "generate_report_async",
     "summarize_report",
     "markdown_to_html",
     "EmailSender",
+    "PipelineState",
+    "video_fingerprint",
     # CrewAI components
     "VideoReportCrew",
     "FrameExtractionTool",
@@ -11,11 +11,22 @@ Integrates with the main video analysis pipeline.
 
 import os
 import sys
+import json
+import bisect
+import hashlib
+import wave
+import shutil
 import logging
+import atexit
 import tempfile
+import threading
+import random
 import subprocess
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Callable, Dict, Any, Optional, List
 from dotenv import load_dotenv
 import re
 
@@ -24,6 +35,30 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Long audio is transcribed as concurrent requests on chunks of this length
+TRANSCRIPTION_CHUNK_SECONDS = 60
+TRANSCRIPTION_MAX_WORKERS = 5
+
+# On-disk cache of transcripts keyed by audio content hash
+TRANSCRIPT_CACHE_DIR = Path.home() / ".cache" / "monkedh" / "transcripts"
+
+# Frame timestamp embedded in extracted frame filenames, e.g. "frame_0002_t2.00s.jpg"
+_TS_RE = re.compile(r't(\d+\.?\d*)s')
+
+# Per-provider caps on in-flight API requests, shared by every pipeline in
+# this process, so concurrent chunk/video processing stays under rate limits
+_GROQ_SEM = threading.BoundedSemaphore(int(os.getenv('GROQ_MAX_CONCURRENCY', '5')))
+_OPENAI_SEM = threading.BoundedSemaphore(int(os.getenv('OPENAI_MAX_CONCURRENCY', '5')))
+_HUME_SEM = threading.BoundedSemaphore(int(os.getenv('HUME_MAX_CONCURRENCY', '2')))
+
+# Retry policy for HTTP 429 responses (exponential backoff with jitter)
+API_MAX_ATTEMPTS = 6
+API_BACKOFF_BASE = 1.0
+API_BACKOFF_MAX = 30.0
+
+# Pre-rendered emotion score bars, indexed by filled length (0-20)
+_BARS = ['█' * i + '░' * (20 - i) for i in range(21)]
+
 # Import audio classification and emotion modules
 try:
     from .audio_classifier import SimpleAudioClassifier
@@ -40,6 +75,14 @@ except ImportError as e:
     SimpleEmotionAnalyzer = None
 
 
+def _file_size(path: str) -> int:
+    """Size of a file in bytes with a single stat call (0 if missing)."""
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
 def extract_audio_from_video(video_path: str) -> Optional[str]:
     """
     Extract audio track from video file.
@@ -76,7 +119,7 @@ def extract_audio_from_video(video_path: str) -> Optional[str]:
         )
         clip.close()
         
-        if Path(tmp_path).exists() and Path(tmp_path).stat().st_size > 0:
+        if _file_size(tmp_path) > 0:
             logger.info(f"Audio extracted successfully to: {tmp_path}")
             return tmp_path
         
@@ -97,22 +140,20 @@ def extract_audio_from_video(video_path: str) -> Optional[str]:
         
         try:
             # Get ffmpeg executable
-            try:
-                import imageio_ffmpeg as iio_ffmpeg
-                ffmpeg_bin = iio_ffmpeg.get_ffmpeg_exe()
-            except Exception:
-                ffmpeg_bin = "ffmpeg"
+            ffmpeg_bin = _get_ffmpeg_bin()
             
             # Extract audio with ffmpeg
             subprocess.run([
-                ffmpeg_bin, "-y", "-i", video_path,
+                ffmpeg_bin, "-y", "-nostdin", "-loglevel", "error",
+                "-i", video_path,
                 "-vn",  # No video
                 "-ac", "1",  # Mono
                 "-ar", "16000",  # 16kHz sample rate
+                "-threads", "0",
                 tmp_path
-            ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             
-            if Path(tmp_path).exists() and Path(tmp_path).stat().st_size > 0:
+            if _file_size(tmp_path) > 0:
                 logger.info(f"Audio extracted with ffmpeg to: {tmp_path}")
                 return tmp_path
             
@@ -126,17 +167,309 @@ def extract_audio_from_video(video_path: str) -> Optional[str]:
         except Exception as e:
             logger.error(f"Failed to extract audio with ffmpeg: {e}")
             try:
-                if Path(tmp_path).exists():
-                    os.unlink(tmp_path)
-            except Exception:
+                os.unlink(tmp_path)
+            except OSError:
                 pass
             return None
 
 
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def _get_http_client():
+    """
+    Shared pooled HTTP client for the Groq, OpenAI and Hume calls.
+    
+    Reusing one client keeps TLS connections alive between requests (and
+    lets concurrent chunk uploads multiplex over HTTP/2 when h2 is installed).
+    """
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                import httpx
+                
+                options = dict(
+                    timeout=httpx.Timeout(60.0, connect=5.0),
+                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+                )
+                try:
+                    client = httpx.Client(http2=True, **options)
+                except ImportError:
+                    # h2 not installed: keep connection pooling over HTTP/1.1
+                    client = httpx.Client(**options)
+                atexit.register(client.close)
+                _http_client = client
+    return _http_client
+
+
+def _get_ffmpeg_bin() -> str:
+    """Return the bundled imageio ffmpeg binary if available, else rely on PATH."""
+    try:
+        import imageio_ffmpeg as iio_ffmpeg
+        return iio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+def has_audio_stream(video_path: str) -> Optional[bool]:
+    """
+    Probe a video container for an audio stream without decoding anything.
+    
+    Args:
+        video_path: Path to video file
+        
+    Returns:
+        True/False, or None if ffmpeg could not be run
+    """
+    try:
+        # ffmpeg with no output file prints the stream list and exits non-zero
+        probe = subprocess.run(
+            [_get_ffmpeg_bin(), "-hide_banner", "-nostdin", "-i", video_path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=30
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Could not probe audio stream: {e}")
+        return None
+    return b"Audio:" in probe.stderr
+
+
+def extract_audio_pcm(video_path: str, sr: int = 16000):
+    """
+    Decode the audio track of a video straight to memory via an ffmpeg pipe.
+    
+    Args:
+        video_path: Path to video file
+        sr: Target sample rate
+        
+    Returns:
+        Mono float32 samples in [-1, 1] or None if no audio / ffmpeg failed
+    """
+    import numpy as np
+    
+    try:
+        proc = subprocess.run([
+            _get_ffmpeg_bin(), "-nostdin", "-loglevel", "error",
+            "-i", video_path,
+            "-vn",  # No video
+            "-ac", "1",  # Mono
+            "-ar", str(sr),
+            "-f", "s16le",  # Raw PCM on stdout, no WAV container
+            "-threads", "0",
+            "-"
+        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except Exception as e:
+        logger.warning(f"ffmpeg PCM decode failed: {e}")
+        return None
+    
+    if not proc.stdout:
+        return None
+    
+    audio = np.frombuffer(proc.stdout, dtype=np.int16).astype(np.float32)
+    audio *= 1.0 / 32768.0
+    logger.info(f"✓ Audio decoded from ffmpeg pipe: {len(audio)} samples @ {sr}Hz")
+    return audio
+
+
+def _wav_duration(audio_path: str) -> float:
+    """Duration of a PCM WAV file in seconds (0.0 if unreadable)."""
+    try:
+        with wave.open(audio_path, "rb") as wav:
+            return wav.getnframes() / float(wav.getframerate())
+    except Exception:
+        return 0.0
+
+
+def _split_wav(audio_path: str, chunk_dir: str, chunk_sec: int = TRANSCRIPTION_CHUNK_SECONDS) -> List[str]:
+    """
+    Split a WAV file into consecutive chunks of at most chunk_sec seconds.
+    
+    Args:
+        audio_path: Path to WAV file
+        chunk_dir: Directory receiving the chunk files
+        chunk_sec: Maximum chunk length in seconds
+        
+    Returns:
+        Ordered list of chunk paths
+    """
+    subprocess.run([
+        _get_ffmpeg_bin(), "-y", "-nostdin", "-loglevel", "error",
+        "-i", audio_path,
+        "-f", "segment",
+        "-segment_time", str(chunk_sec),
+        "-c", "copy",
+        os.path.join(chunk_dir, "chunk_%04d.wav")
+    ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return sorted(str(p) for p in Path(chunk_dir).glob("chunk_*.wav"))
+
+
+def _transcribe_in_chunks(
+    transcribe_file: Callable[[str], Dict[str, Any]],
+    audio_path: str
+) -> Dict[str, Any]:
+    """
+    Transcribe long audio as concurrent chunk requests and stitch the results.
+    
+    Short files are sent in a single request. Segment timestamps of each
+    chunk are shifted by the duration of the chunks before it.
+    
+    Args:
+        transcribe_file: Function transcribing a single file
+        audio_path: Path to WAV file
+        
+    Returns:
+        Merged transcription result
+    """
+    if _wav_duration(audio_path) <= TRANSCRIPTION_CHUNK_SECONDS:
+        return transcribe_file(audio_path)
+    
+    chunk_dir = tempfile.mkdtemp(prefix="monkedh_audio_chunks_")
+    try:
+        chunk_paths = _split_wav(audio_path, chunk_dir)
+        if not chunk_paths:
+            return transcribe_file(audio_path)
+        
+        logger.info(f"Transcribing {len(chunk_paths)} audio chunks concurrently")
+        with ThreadPoolExecutor(max_workers=TRANSCRIPTION_MAX_WORKERS) as pool:
+            chunk_results = list(pool.map(transcribe_file, chunk_paths))
+        
+        merged = {
+            "full_transcript": "",
+            "language": chunk_results[0].get("language") if chunk_results else None,
+            "duration": 0,
+            "segments": []
+        }
+        texts = []
+        offset = 0.0
+        for chunk_path, result in zip(chunk_paths, chunk_results):
+            texts.append((result.get("full_transcript") or "").strip())
+            for seg in result.get("segments", []):
+                merged["segments"].append({
+                    "start_time": seg["start_time"] + offset,
+                    "end_time": seg["end_time"] + offset,
+                    "text": seg["text"]
+                })
+            offset += _wav_duration(chunk_path)
+        
+        merged["full_transcript"] = " ".join(t for t in texts if t)
+        merged["duration"] = offset
+        return merged
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    """Whether an SDK or httpx error is an HTTP 429 response."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status == 429
+
+
+def _call_api(semaphore: threading.BoundedSemaphore, call: Callable[[], Any]) -> Any:
+    """
+    Run an API call under a provider semaphore, retrying on rate limits.
+    
+    The semaphore is released while backing off so other requests can
+    use the slot.
+    
+    Args:
+        semaphore: Provider concurrency limit
+        call: Zero-argument function performing the request
+        
+    Returns:
+        Result of call()
+    """
+    for attempt in range(1, API_MAX_ATTEMPTS + 1):
+        try:
+            with semaphore:
+                return call()
+        except Exception as e:
+            if attempt == API_MAX_ATTEMPTS or not _is_rate_limited(e):
+                raise
+            delay = min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** (attempt - 1))
+            delay += random.uniform(0, API_BACKOFF_BASE)
+            logger.warning(f"Rate limited, retrying in {delay:.1f}s (attempt {attempt}/{API_MAX_ATTEMPTS})")
+            time.sleep(delay)
+
+
+def _transcript_cache_key(audio_path: str, model: str, language: str) -> str:
+    """Fingerprint an audio file (blake2b, hashed in 1 MB blocks) for the transcript cache."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(audio_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return f"{digest.hexdigest()}_{model}_{language}"
+
+
+def _load_cached_transcript(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Return a cached transcription result, or None on miss."""
+    cache_file = TRANSCRIPT_CACHE_DIR / f"{cache_key}.json"
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            transcript = json.load(f)
+        logger.info(f"✓ Transcript cache hit: {cache_key}")
+        return transcript
+    except (OSError, ValueError):
+        return None
+
+
+def _store_cached_transcript(cache_key: str, transcript: Dict[str, Any]) -> None:
+    """Persist a transcription result; cache failures are never fatal."""
+    try:
+        TRANSCRIPT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(TRANSCRIPT_CACHE_DIR / f"{cache_key}.json", "w", encoding="utf-8") as f:
+            json.dump(transcript, f, ensure_ascii=False)
+    except (OSError, TypeError) as e:
+        logger.warning(f"Could not cache transcript: {e}")
+
+
+def _transcribe_file_groq(client, audio_path: str, language: str) -> Dict[str, Any]:
+    """Send a single audio file to Groq Whisper and normalize the response."""
+    def request():
+        with open(audio_path, "rb") as audio_file:
+            return client.audio.transcriptions.create(
+                file=audio_file,
+                model="whisper-large-v3",
+                language=language,
+                response_format="verbose_json"
+            )
+    
+    transcription = _call_api(_GROQ_SEM, request)
+    
+    # Parse segments - they can be dicts or objects
+    segments = []
+    if hasattr(transcription, 'segments') and transcription.segments:
+        for seg in transcription.segments:
+            if isinstance(seg, dict):
+                segments.append({
+                    "start_time": seg.get("start", 0),
+                    "end_time": seg.get("end", 0),
+                    "text": seg.get("text", "")
+                })
+            else:
+                segments.append({
+                    "start_time": getattr(seg, "start", 0),
+                    "end_time": getattr(seg, "end", 0),
+                    "text": getattr(seg, "text", "")
+                })
+    
+    return {
+        "full_transcript": transcription.text,
+        "language": getattr(transcription, "language", language),
+        "duration": getattr(transcription, "duration", 0),
+        "segments": segments
+    }
+
+
 def transcribe_audio_groq(audio_path: str, language: str = "fr") -> Optional[Dict[str, Any]]:
     """
     Transcribe audio using Groq Whisper API.
     
+    Long audio is split into chunks that are transcribed concurrently.
+    
     Args:
         audio_path: Path to audio file
         language: Language code (fr, ar, en)
@@ -150,51 +483,60 @@ def transcribe_audio_groq(audio_path: str, language: str = "fr") -> Optional[Dic
         return None
     
     try:
+        cache_key = _transcript_cache_key(audio_path, "whisper-large-v3", language)
+        cached = _load_cached_transcript(cache_key)
+        if cached is not None:
+            return cached
+        
         from groq import Groq
         
-        client = Groq(api_key=api_key)
+        client = Groq(api_key=api_key, http_client=_get_http_client())
+        transcript = _transcribe_in_chunks(
+            partial(_transcribe_file_groq, client, language=language),
+            audio_path
+        )
+        _store_cached_transcript(cache_key, transcript)
+        return transcript
         
+    except Exception as e:
+        logger.error(f"Groq transcription failed: {e}")
+        return None
+
+
+def _transcribe_file_openai(client, audio_path: str, language: str) -> Dict[str, Any]:
+    """Send a single audio file to OpenAI Whisper and normalize the response."""
+    def request():
         with open(audio_path, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
+            return client.audio.transcriptions.create(
                 file=audio_file,
-                model="whisper-large-v3",
+                model="whisper-1",
                 language=language,
                 response_format="verbose_json"
             )
-        
-        # Parse segments - they can be dicts or objects
-        segments = []
-        if hasattr(transcription, 'segments') and transcription.segments:
-            for seg in transcription.segments:
-                if isinstance(seg, dict):
-                    segments.append({
-                        "start_time": seg.get("start", 0),
-                        "end_time": seg.get("end", 0),
-                        "text": seg.get("text", "")
-                    })
-                else:
-                    segments.append({
-                        "start_time": getattr(seg, "start", 0),
-                        "end_time": getattr(seg, "end", 0),
-                        "text": getattr(seg, "text", "")
-                    })
-        
-        return {
-            "full_transcript": transcription.text,
-            "language": getattr(transcription, "language", language),
-            "duration": getattr(transcription, "duration", 0),
-            "segments": segments
-        }
-        
-    except Exception as e:
-        logger.error(f"Groq transcription failed: {e}")
-        return None
+    
+    transcription = _call_api(_OPENAI_SEM, request)
+    
+    return {
+        "full_transcript": transcription.text,
+        "language": transcription.language,
+        "duration": transcription.duration,
+        "segments": [
+            {
+                "start_time": seg["start"],
+                "end_time": seg["end"],
+                "text": seg["text"]
+            }
+            for seg in (transcription.segments or [])
+        ]
+    }
 
 
 def transcribe_audio_openai(audio_path: str, language: str = "fr") -> Optional[Dict[str, Any]]:
     """
     Transcribe audio using OpenAI Whisper API.
     
+    Long audio is split into chunks that are transcribed concurrently.
+    
     Args:
         audio_path: Path to audio file
         language: Language code
@@ -208,31 +550,20 @@ def transcribe_audio_openai(audio_path: str, language: str = "fr") -> Optional[D
         return None
     
     try:
-        from openai import OpenAI
+        cache_key = _transcript_cache_key(audio_path, "whisper-1", language)
+        cached = _load_cached_transcript(cache_key)
+        if cached is not None:
+            return cached
         
-        client = OpenAI(api_key=api_key)
-        
-        with open(audio_path, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
-                file=audio_file,
-                model="whisper-1",
-                language=language,
-                response_format="verbose_json"
-            )
+        from openai import OpenAI
         
-        return {
-            "full_transcript": transcription.text,
-            "language": transcription.language,
-            "duration": transcription.duration,
-            "segments": [
-                {
-                    "start_time": seg["start"],
-                    "end_time": seg["end"],
-                    "text": seg["text"]
-                }
-                for seg in (transcription.segments or [])
-            ]
-        }
+        client = OpenAI(api_key=api_key, http_client=_get_http_client())
+        transcript = _transcribe_in_chunks(
+            partial(_transcribe_file_openai, client, language=language),
+            audio_path
+        )
+        _store_cached_transcript(cache_key, transcript)
+        return transcript
         
     except Exception as e:
         logger.error(f"OpenAI transcription failed: {e}")
@@ -255,42 +586,150 @@ def analyze_emotions_hume(audio_path: str) -> Optional[Dict[str, Any]]:
         return None
     
     try:
-        import httpx
-        import base64
-        
-        # Read and encode audio
-        with open(audio_path, "rb") as f:
-            audio_data = base64.b64encode(f.read()).decode()
-        
         headers = {
-            "X-Hume-Api-Key": api_key,
-            "Content-Type": "application/json"
+            "X-Hume-Api-Key": api_key
         }
         
-        # Note: This is a simplified example. Hume's actual API may differ.
-        # You may need to use their official SDK or different endpoint.
-        payload = {
-            "models": {
-                "prosody": {}
-            },
-            "raw_text": False,
-            "data": audio_data
+        # Batch job config goes in the "json" form field; the audio is
+        # streamed from disk as a multipart file part
+        data = {
+            "json": json.dumps({"models": {"prosody": {}}})
         }
         
-        with httpx.Client(timeout=60.0) as client:
-            response = client.post(
-                "https://api.hume.ai/v0/batch/jobs",
-                json=payload,
-                headers=headers
-            )
+        client = _get_http_client()
+        
+        def request():
+            with open(audio_path, "rb") as audio_file:
+                response = client.post(
+                    "https://api.hume.ai/v0/batch/jobs",
+                    headers=headers,
+                    files={"file": (Path(audio_path).name, audio_file, "audio/wav")},
+                    data=data
+                )
             response.raise_for_status()
             return response.json()
+        
+        return _call_api(_HUME_SEM, request)
             
     except Exception as e:
         logger.error(f"Hume emotion analysis failed: {e}")
         return None
 
 
+def _load_audio(audio_path: str):
+    """Load a WAV file as mono float32 samples, returning (audio, sr) or (None, sr)."""
+    sr = 16000
+    try:
+        import librosa
+        logger.info("Loading audio with librosa...")
+        audio, sr = librosa.load(audio_path, sr=16000)
+        logger.info(f"✓ Audio loaded: {len(audio)} samples @ {sr}Hz")
+        return audio, sr
+    except Exception as e:
+        logger.warning(f"Librosa failed: {e}, trying scipy...")
+        try:
+            import numpy as np
+            from scipy.io import wavfile
+            sr, audio_raw = wavfile.read(audio_path)
+            # Downmix to mono first so the scaling below touches half the samples
+            if audio_raw.ndim == 2:
+                audio = audio_raw.mean(axis=1, dtype=np.float32)
+            else:
+                audio = audio_raw.astype(np.float32, copy=False)
+            if np.issubdtype(audio_raw.dtype, np.integer):
+                # astype() already copied integer PCM, so scale that buffer in place
+                np.multiply(audio, np.float32(1.0 / np.iinfo(audio_raw.dtype).max), out=audio)
+            logger.info(f"✓ Audio loaded with scipy: {len(audio)} samples @ {sr}Hz")
+            return audio, sr
+        except Exception as e2:
+            logger.error(f"Failed to load audio: {e2}")
+            return None, sr
+
+
+def _remove_file(path: Optional[str]) -> None:
+    """Delete a temporary file, ignoring errors."""
+    if not path:
+        return
+    try:
+        os.unlink(path)
+        logger.debug(f"Cleaned up: {path}")
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Cleanup failed: {e}")
+
+
+def _transcription_configured() -> bool:
+    """Whether any speech-to-text API key is available."""
+    return bool(os.getenv('GROQ_API_KEY') or os.getenv('API_KEY') or os.getenv('OPENAI_API_KEY'))
+
+
+def _classify_phase(video_path: str, classifier_future: Optional[Future] = None) -> Dict[str, Any]:
+    """PHASE 1: decode the audio and classify/segment it.
+    
+    If classifier_future is given, the classifier (and its model) is being
+    loaded concurrently while the audio is decoded.
+    """
+    logger.info("PHASE 1: Audio Classification & Segmentation")
+    phase_results = {}
+    
+    # Decode straight from ffmpeg into memory; only go through a WAV file
+    # if the pipe is unavailable
+    sr = 16000
+    audio = extract_audio_pcm(video_path, sr)
+    if audio is None:
+        audio_path = extract_audio_from_video(video_path)
+        if not audio_path:
+            return phase_results
+        try:
+            audio, sr = _load_audio(audio_path)
+        finally:
+            _remove_file(audio_path)
+    if audio is None:
+        return phase_results
+    
+    phase_results["has_audio"] = True
+    
+    try:
+        classifier = classifier_future.result() if classifier_future else SimpleAudioClassifier()
+        classification_results = classifier.classify_audio(audio, sr)
+        
+        if classification_results.get('segments'):
+            # The classifier already emits the report's segment shape
+            phase_results["segments"] = classification_results["segments"]
+            logger.info(f"✓ Segmented into {len(phase_results['segments'])} parts")
+        
+        if classification_results.get('top_categories'):
+            phase_results["audio_events"] = list(classification_results["top_categories"].keys())
+            logger.info(f"✓ Detected events: {', '.join(phase_results['audio_events'][:5])}")
+        
+    except Exception as e:
+        logger.error(f"✗ Classification failed: {e}")
+    
+    return phase_results
+
+
+def _transcription_phase(video_path: str, language: str) -> Optional[Dict[str, Any]]:
+    """PHASE 2: transcribe speech with Groq, falling back to OpenAI."""
+    logger.info("PHASE 2: Speech Transcription")
+    if not _transcription_configured():
+        logger.warning("No Groq/OpenAI API key found for transcription")
+        return None
+    
+    # The APIs need an uploadable file, so only here is a WAV materialized
+    audio_path = extract_audio_from_video(video_path)
+    if not audio_path:
+        return None
+    
+    try:
+        transcription = transcribe_audio_groq(audio_path, language)
+        if not transcription:
+            transcription = transcribe_audio_openai(audio_path, language)
+        return transcription
+    finally:
+        _remove_file(audio_path)
+
+
 def analyze_video_audio(video_path: str, language: str = "fr") -> Optional[Dict[str, Any]]:
     """
     Complete audio analysis workflow for a video.
@@ -299,116 +738,83 @@ def analyze_video_audio(video_path: str, language: str = "fr") -> Optional[Dict[
     2. Speech transcription (Groq or OpenAI)
     3. Emotion detection (from transcription text)
     
+    Phases 1 and 2 are independent and run concurrently; phase 3 starts
+    once the transcript is available.
+    
     Args:
         video_path: Path to video file
         language: Language for transcription
         
     Returns:
-        Dictionary with all audio analysis results
+        Dictionary with all audio analysis results ("error" is set when a
+        phase failed and the results are partial)
     """
-    # Extract audio from video
-    audio_path = extract_audio_from_video(video_path)
-    
-    if not audio_path:
-        logger.warning("No audio track found in video")
-        return None
-    
     results = {
         "has_audio": True,
         "segments": [],
         "emotions": [],
         "audio_events": []
     }
+    classification = {}
+    transcription = None
     
     try:
         logger.info("=" * 60)
         logger.info("AUDIO ANALYSIS PIPELINE")
         logger.info("=" * 60)
         
-        # Load audio for analysis
-        audio = None
-        sr = 16000
-        try:
-            import librosa
-            logger.info("Loading audio with librosa...")
-            audio, sr = librosa.load(audio_path, sr=16000)
-            logger.info(f"✓ Audio loaded: {len(audio)} samples @ {sr}Hz")
-        except Exception as e:
-            logger.warning(f"Librosa failed: {e}, trying scipy...")
+        # PHASES 1 + 2: classification and transcription in parallel, with
+        # the classifier model loading while ffmpeg decodes the audio
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            classifier_future = pool.submit(SimpleAudioClassifier)
+            classify_future = pool.submit(_classify_phase, video_path, classifier_future)
+            transcribe_future = pool.submit(_transcription_phase, video_path, language)
+            
             try:
-                import numpy as np
-                from scipy.io import wavfile
-                sr, audio_raw = wavfile.read(audio_path)
-                audio = audio_raw.astype(np.float32)
-                if np.max(np.abs(audio)) > 1:
-                    audio = audio / np.iinfo(audio_raw.dtype).max
-                logger.info(f"✓ Audio loaded with scipy: {len(audio)} samples @ {sr}Hz")
-            except Exception as e2:
-                logger.error(f"Failed to load audio: {e2}")
-                audio = None
-        
-        # PHASE 1: Audio Classification
-        logger.info("\nPHASE 1: Audio Classification & Segmentation")
-        logger.info("-" * 60)
-        if audio is not None:
+                transcription = transcribe_future.result()
+            except Exception as e:
+                logger.error(f"✗ Transcription failed: {e}")
+                results["error"] = f"transcription: {e}"
+            
+            if transcription:
+                results["transcription"] = transcription
+                results["full_transcript"] = transcription.get("full_transcript", "")
+                results["duration"] = transcription.get("duration", 0)
+                results["language"] = transcription.get("language", language)
+                logger.info(f"✓ Transcribed: {len(results['full_transcript'])} chars")
+                logger.info(f"  Text: {results['full_transcript'][:80]}...")
+            else:
+                logger.warning("✗ No transcription obtained")
+            
+            # PHASE 3: Emotion Detection (overlaps with classification if still running)
+            logger.info("PHASE 3: Emotion Detection")
             try:
-                classifier = SimpleAudioClassifier()
-                classification_results = classifier.classify_audio(audio, sr)
-                
-                if classification_results.get('segments'):
-                    results["segments"] = [
-                        {
-                            "start_time": seg["start_time"],
-                            "end_time": seg["end_time"],
-                            "category": seg["category"],
-                            "confidence": seg["confidence"]
-                        }
-                        for seg in classification_results["segments"]
-                    ]
-                    logger.info(f"✓ Segmented into {len(results['segments'])} parts")
-                
-                if classification_results.get('top_categories'):
-                    results["audio_events"] = list(classification_results["top_categories"].keys())
-                    logger.info(f"✓ Detected events: {', '.join(results['audio_events'][:5])}")
-                
+                analyzer = SimpleEmotionAnalyzer()
+                if results.get("full_transcript"):
+                    emotions = analyzer.analyze_text(results["full_transcript"])
+                    if emotions:
+                        results["emotions"] = emotions
+                        logger.info(f"✓ Detected emotions:")
+                        for emotion in emotions:
+                            logger.info(f"  - {emotion['name']}: {emotion['score']*100:.1f}%")
+                    else:
+                        logger.warning("✗ No emotions detected")
+                else:
+                    logger.warning("✗ No transcript for emotion analysis")
+            except Exception as e:
+                logger.error(f"✗ Emotion analysis failed: {e}")
+                results["error"] = f"emotions: {e}"
+            
+            try:
+                classification = classify_future.result()
+                results.update(classification)
             except Exception as e:
                 logger.error(f"✗ Classification failed: {e}")
+                results["error"] = f"classification: {e}"
         
-        # PHASE 2: Speech Transcription
-        logger.info("\nPHASE 2: Speech Transcription")
-        logger.info("-" * 60)
-        transcription = transcribe_audio_groq(audio_path, language)
-        if not transcription:
-            transcription = transcribe_audio_openai(audio_path, language)
-        
-        if transcription:
-            results["transcription"] = transcription
-            results["full_transcript"] = transcription.get("full_transcript", "")
-            results["duration"] = transcription.get("duration", 0)
-            results["language"] = transcription.get("language", language)
-            logger.info(f"✓ Transcribed: {len(results['full_transcript'])} chars")
-            logger.info(f"  Text: {results['full_transcript'][:80]}...")
-        else:
-            logger.warning("✗ No transcription obtained")
-        
-        # PHASE 3: Emotion Detection
-        logger.info("\nPHASE 3: Emotion Detection")
-        logger.info("-" * 60)
-        try:
-            analyzer = SimpleEmotionAnalyzer()
-            if results.get("full_transcript"):
-                emotions = analyzer.analyze_text(results["full_transcript"])
-                if emotions:
-                    results["emotions"] = emotions
-                    logger.info(f"✓ Detected emotions:")
-                    for emotion in emotions:
-                        logger.info(f"  - {emotion['name']}: {emotion['score']*100:.1f}%")
-                else:
-                    logger.warning("✗ No emotions detected")
-            else:
-                logger.warning("✗ No transcript for emotion analysis")
-        except Exception as e:
-            logger.error(f"✗ Emotion analysis failed: {e}")
+        if not classification.get("has_audio") and not transcription:
+            logger.warning("No audio track found in video")
+            return None
         
         logger.info("\n" + "=" * 60)
         logger.info("✓ AUDIO ANALYSIS COMPLETE")
@@ -419,16 +825,8 @@ def analyze_video_audio(video_path: str, language: str = "fr") -> Optional[Dict[
         logger.error(f"Fatal error during audio analysis: {e}")
         import traceback
         logger.error(traceback.format_exc())
+        results["error"] = str(e)
         return results
-        
-    finally:
-        # Clean up
-        try:
-            if audio_path and Path(audio_path).exists():
-                os.unlink(audio_path)
-                logger.debug(f"Cleaned up: {audio_path}")
-        except Exception as e:
-            logger.warning(f"Cleanup failed: {e}")
 
 
 def format_audio_summary(results: Dict[str, Any]) -> str:
@@ -530,9 +928,8 @@ def format_audio_summary(results: Dict[str, Any]) -> str:
             name = emotion.get('name', 'unknown')
             score = emotion.get('score', 0)
             percentage = score * 100
-            # Create a simple progress bar
-            bar_length = int(percentage / 5)  # 20 chars max
-            bar = '█' * bar_length + '░' * (20 - bar_length)
+            # Simple progress bar (20 chars max)
+            bar = _BARS[max(0, min(20, int(percentage / 5)))]
             lines.append(f"- **{name}:** {percentage:.1f}% `{bar}`")
         lines.append("")
     
@@ -567,7 +964,12 @@ def correlate_audio_with_frames(
         return frame_descriptions
     
     transcription = audio_results.get('transcription', {})
-    segments = transcription.get('segments', [])
+    segments = sorted(
+        transcription.get('segments', []),
+        key=lambda seg: seg.get('start_time', 0)
+    )
+    starts = [seg.get('start_time', 0) for seg in segments]
+    ends = [seg.get('end_time', 0) for seg in segments]
     
     integrated_frames = []
     
@@ -578,25 +980,31 @@ def correlate_audio_with_frames(
             frame_time = float(frame['timestamp'])
         elif 'frame_path' in frame:
             # Try to extract from filename like "frame_0002_t2.00s.jpg"
-            match = re.search(r't(\d+\.?\d*)s', frame['frame_path'])
+            match = _TS_RE.search(frame['frame_path'])
             if match:
                 frame_time = float(match.group(1))
         
-        # Find speech segments near this frame (within 1 second window)
+        # Find speech segments near this frame (within 1 second window).
+        # Segments are sorted and non-overlapping, so the first one ending at
+        # or after the frame is the only candidate that can contain it, and
+        # the first one starting after frame_time - 1s is the earliest "near"
+        # candidate.
         frame_audio = {
             'speech': None,
             'speech_text': None
         }
         
-        for seg in segments:
-            seg_start = seg.get('start_time', 0)
-            seg_end = seg.get('end_time', 0)
-            
-            # Check if frame is within this speech segment
-            if seg_start <= frame_time <= seg_end or abs(seg_start - frame_time) < 1.0:
-                frame_audio['speech'] = True
-                frame_audio['speech_text'] = seg.get('text', '')
-                break
+        candidates = []
+        containing = bisect.bisect_left(ends, frame_time)
+        if containing < len(ends) and starts[containing] <= frame_time:
+            candidates.append(containing)
+        nearby = bisect.bisect_right(starts, frame_time - 1.0)
+        if nearby < len(starts) and starts[nearby] < frame_time + 1.0:
+            candidates.append(nearby)
+        
+        if candidates:
+            frame_audio['speech'] = True
+            frame_audio['speech_text'] = segments[min(candidates)].get('text', '')
         
         # Add audio to frame
         integrated_frame = frame.copy()
@@ -10,7 +10,9 @@ from crewai.agents.agent_builder.base_agent import BaseAgent
 from crewai import LLM
 from typing import List, Optional
 from pathlib import Path
+from functools import lru_cache
 import os
+import logging
 
 from dotenv import load_dotenv
 
@@ -21,11 +23,45 @@ from .tools import (
     AudioAnalysisTool,
     VideoInfoTool
 )
+from .frame_extractor import get_video_info
 
 # Load environment variables
 env_path = Path(__file__).parent.parent.parent.parent.parent / ".env"
 load_dotenv(env_path)
 
+logger = logging.getLogger(__name__)
+
+# Completion cap for agent turns on the self-hosted fallback model
+FALLBACK_MAX_TOKENS = int(os.getenv("LLAVA_MAX_TOKENS", "2048"))
+
+
+@lru_cache(maxsize=None)
+def _check_vllm_endpoint(base_url: str, api_key: Optional[str]) -> bool:
+    """Check once per endpoint that the fallback server is vLLM.
+    
+    vLLM's continuous batching is what makes the concurrent vision and
+    audio requests cheap; a plain HF text-generation server handles them
+    one at a time.
+    """
+    import httpx
+    
+    try:
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        response = httpx.get(f"{base_url.rstrip('/')}/models", headers=headers, timeout=5.0, verify=False)
+        response.raise_for_status()
+        owners = {model.get("owned_by") for model in response.json().get("data", [])}
+    except Exception as e:
+        logger.warning(f"Could not probe fallback LLM endpoint {base_url}: {e}")
+        return False
+    
+    if "vllm" not in owners:
+        logger.warning(
+            f"Fallback LLM endpoint {base_url} does not look like a vLLM server "
+            f"(owned_by={sorted(o for o in owners if o)}); concurrent requests will not be batched"
+        )
+        return False
+    return True
+
 
 # Configure Azure OpenAI LLM for agents
 def get_llm():
@@ -41,12 +77,17 @@ def get_llm():
             api_version=os.getenv("AZURE_API_VERSION", "2024-12-01-preview"),
         )
     
-    # Fallback to TokenFactory Llama
+    # Fallback to TokenFactory Llama (vLLM, OpenAI-compatible)
+    api_key = os.getenv("LLAVA_API_KEY")
+    base_url = os.getenv("LLAVA_BASE_URL", "https://tokenfactory.esprit.tn/api")
+    _check_vllm_endpoint(base_url, api_key)
+    
     return LLM(
         model="openai/hosted_vllm/Llama-3.1-70B-Instruct",
-        api_key=os.getenv("LLAVA_API_KEY"),
-        base_url=os.getenv("LLAVA_BASE_URL", "https://tokenfactory.esprit.tn/api"),
+        api_key=api_key,
+        base_url=base_url,
         temperature=0.1,
+        max_tokens=FALLBACK_MAX_TOKENS,
     )
 
 
@@ -66,6 +107,12 @@ class VideoReportCrew:
         self.audio_tool = AudioAnalysisTool()
         self.video_info_tool = VideoInfoTool()
         self.llm = get_llm()
+        
+        # Build each agent once; tasks and the crew share these instances
+        self.frame_extractor = self.frame_extractor_agent()
+        self.vision_analyst = self.vision_analyst_agent()
+        self.audio_analyst = self.audio_analyst_agent()
+        self.report_generator = self.report_generator_agent()
     
     def frame_extractor_agent(self) -> Agent:
         """Create the frame extraction agent."""
@@ -136,11 +183,15 @@ class VideoReportCrew:
             Sauvegarder les frames extraites avec des horodatages clairs.
             Retourner la liste complète des chemins vers les frames extraites.""",
             expected_output="Liste de chemins de fichiers vers toutes les frames extraites.",
-            agent=self.frame_extractor_agent()
+            agent=self.frame_extractor
         )
     
-    def create_vision_task(self, language: str = "français") -> Task:
-        """Create vision analysis task."""
+    def create_vision_task(
+        self,
+        language: str = "français",
+        context: Optional[List[Task]] = None
+    ) -> Task:
+        """Create vision analysis task (runs asynchronously alongside audio)."""
         return Task(
             description=f"""Analyser chaque frame vidéo extraite pour fournir des observations sur:
             
@@ -151,13 +202,18 @@ class VideoReportCrew:
             5. ENVIRONNEMENT: Décrire le cadre général
             
             Langue d'analyse: {language}
-            Soyez SPÉCIFIQUE concernant toute personne en détresse.""",
+            Soyez SPÉCIFIQUE concernant toute personne en détresse.
+            
+            Appeler l'outil UNE SEULE FOIS avec la liste complète des frames:
+            l'outil les analyse en parallèle.""",
             expected_output="Liste de descriptions détaillées frame par frame.",
-            agent=self.vision_analyst_agent()
+            agent=self.vision_analyst,
+            context=context,
+            async_execution=True
         )
     
     def create_audio_task(self, video_path: str, language: str = "fr") -> Task:
-        """Create audio analysis task."""
+        """Create audio analysis task (independent of frames, runs asynchronously)."""
         return Task(
             description=f"""Analyser la piste audio de la vidéo: {video_path}
             
@@ -166,11 +222,16 @@ class VideoReportCrew:
             3. Détecter les émotions dans la parole
             4. Créer une chronologie des événements audio importants""",
             expected_output="Résumé complet de l'analyse audio avec transcription et émotions.",
-            agent=self.audio_analyst_agent()
+            agent=self.audio_analyst,
+            async_execution=True
         )
     
-    def create_report_task(self, language: str = "français") -> Task:
-        """Create report generation task."""
+    def create_report_task(
+        self,
+        language: str = "français",
+        context: Optional[List[Task]] = None
+    ) -> Task:
+        """Create report generation task, waiting on the given analysis tasks."""
         return Task(
             description=f"""Générer un rapport d'incident complet en {language} incluant:
             
@@ -182,7 +243,8 @@ class VideoReportCrew:
             
             Le rapport doit être professionnel et exploitable par les équipes d'intervention.""",
             expected_output="Chemin vers le rapport Markdown et HTML généré.",
-            agent=self.report_generator_agent(),
+            agent=self.report_generator,
+            context=context,
             output_file='output/report.md'
         )
     
@@ -205,6 +267,15 @@ class VideoReportCrew:
         Returns:
             Dictionary with analysis results and report paths
         """
+        # Silent footage: don't spend an agent + transcription pipeline on it
+        # (has_audio is cached with the video properties, so this is cheap)
+        if include_audio:
+            try:
+                if get_video_info(video_path)["has_audio"] is False:
+                    include_audio = False
+            except RuntimeError:
+                pass
+        
         print("\n" + "="*60)
         print("🎥 MONKEDH - Video Incident Analysis System")
         print("="*60)
@@ -221,24 +292,26 @@ class VideoReportCrew:
         # Frame extraction
         extraction_task = self.create_extraction_task(video_path, sample_rate)
         tasks.append(extraction_task)
-        agents.append(self.frame_extractor_agent())
+        agents.append(self.frame_extractor)
         
-        # Vision analysis
-        vision_task = self.create_vision_task(language)
+        # Vision and audio analysis run concurrently once frames exist
+        vision_task = self.create_vision_task(language, context=[extraction_task])
         tasks.append(vision_task)
-        agents.append(self.vision_analyst_agent())
+        agents.append(self.vision_analyst)
+        analysis_tasks = [vision_task]
         
         # Audio analysis (optional)
         if include_audio:
             audio_lang = "ar" if language == "arabe" else "fr"
             audio_task = self.create_audio_task(video_path, audio_lang)
             tasks.append(audio_task)
-            agents.append(self.audio_analyst_agent())
+            agents.append(self.audio_analyst)
+            analysis_tasks.append(audio_task)
         
-        # Report generation
-        report_task = self.create_report_task(language)
+        # Report generation blocks until every analysis task has finished
+        report_task = self.create_report_task(language, context=analysis_tasks)
         tasks.append(report_task)
-        agents.append(self.report_generator_agent())
+        agents.append(self.report_generator)
         
         # Create and run crew
         crew = Crew(
@@ -1,17 +1,21 @@
 """Email sender module for sending analysis reports."""
 import os
+import mmap
+import base64
 import logging
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
-from email import encoders
 from pathlib import Path
 from typing import Optional, List
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Larger files are not attached (mail servers reject them anyway)
+MAX_ATTACHMENT_BYTES = int(os.getenv('MAX_ATTACHMENT_BYTES', str(10 * 1024 * 1024)))
+
 
 class EmailSender:
     """Handles sending emails with report attachments."""
@@ -68,23 +72,54 @@ class EmailSender:
             return False
         
         try:
-            # Create message
-            msg = MIMEMultipart('alternative')
+            msg = self._build_message(recipient_email, report_path, html_report_path, subject, language)
+            if self._send_many(msg, [recipient_email]):
+                return False
             
-            # Set subject
-            if subject is None:
-                if language == "arabe":
-                    subject = f"تقرير تحليل الفيديو - Monkedh - {datetime.now().strftime('%d/%m/%Y')}"
-                else:
-                    subject = f"Rapport d'Analyse Vidéo - Monkedh - {datetime.now().strftime('%d/%m/%Y')}"
+            logger.info(f"Email sent successfully to: {recipient_email}")
+            return True
             
-            msg['From'] = self.sender_email
-            msg['To'] = recipient_email
-            msg['Subject'] = subject
+        except Exception as e:
+            logger.error(f"Failed to send email: {e}")
+            return False
+    
+    def _build_message(
+        self,
+        recipient_email: str,
+        report_path: str,
+        html_report_path: Optional[str] = None,
+        subject: Optional[str] = None,
+        language: str = "français"
+    ) -> MIMEMultipart:
+        """Assemble the report email (body, inline HTML and attachments).
+        
+        Args:
+            recipient_email: Recipient email address
+            report_path: Path to markdown report file
+            html_report_path: Optional path to HTML report
+            subject: Email subject (auto-generated if None)
+            language: Report language for email content
             
-            # Create email body
+        Returns:
+            MIME message ready to send
+        """
+        # Create message
+        msg = MIMEMultipart('alternative')
+        
+        # Set subject
+        if subject is None:
             if language == "arabe":
-                text_body = """
+                subject = f"تقرير تحليل الفيديو - Monkedh - {datetime.now().strftime('%d/%m/%Y')}"
+            else:
+                subject = f"Rapport d'Analyse Vidéo - Monkedh - {datetime.now().strftime('%d/%m/%Y')}"
+        
+        msg['From'] = self.sender_email
+        msg['To'] = recipient_email
+        msg['Subject'] = subject
+        
+        # Create email body
+        if language == "arabe":
+            text_body = """
 مرحبًا،
 
 يرجى الاطلاع على تقرير تحليل الفيديو المرفق.
@@ -94,9 +129,9 @@ class EmailSender:
 مع أطيب التحيات،
 فريق Monkedh
 وزارة الصحة - الجمهورية التونسية
-                """
-            else:
-                text_body = """
+            """
+        else:
+            text_body = """
 Bonjour,
 
 Veuillez trouver ci-joint le rapport d'analyse vidéo.
@@ -106,47 +141,91 @@ Ce rapport a été généré automatiquement par le système Monkedh.
 Cordialement,
 L'équipe Monkedh
 Ministère de la Santé - République Tunisienne
-                """
-            
-            msg.attach(MIMEText(text_body, 'plain', 'utf-8'))
-            
-            # Attach HTML content if available
-            if html_report_path and Path(html_report_path).exists():
-                with open(html_report_path, 'r', encoding='utf-8') as f:
-                    html_content = f.read()
-                msg.attach(MIMEText(html_content, 'html', 'utf-8'))
-            
-            # Attach markdown report
-            if Path(report_path).exists():
-                self._attach_file(msg, report_path)
-            
-            # Attach HTML report as file
-            if html_report_path and Path(html_report_path).exists():
-                self._attach_file(msg, html_report_path)
+            """
+        
+        msg.attach(MIMEText(text_body, 'plain', 'utf-8'))
+        
+        # Read the HTML report once; it is both the inline body and an attachment
+        html_bytes = None
+        if html_report_path:
+            try:
+                html_bytes = Path(html_report_path).read_bytes()
+            except OSError:
+                pass
+        
+        # Attach HTML content if available
+        if html_bytes is not None:
+            msg.attach(MIMEText(html_bytes.decode('utf-8'), 'html', 'utf-8'))
+        
+        # Attach markdown report
+        if Path(report_path).exists():
+            self._attach_file(msg, report_path)
+        
+        # Attach HTML report as file
+        if html_bytes is not None:
+            self._attach_bytes(msg, html_bytes, Path(html_report_path).name)
+        
+        return msg
+    
+    def _send_many(self, msg: MIMEMultipart, recipient_emails: List[str]) -> List[str]:
+        """Send a message to each recipient over a single SMTP session.
+        
+        One connect + TLS + login is shared by every recipient. Port 465
+        uses implicit TLS, which saves the STARTTLS round-trip.
+        
+        Args:
+            msg: Message to send (its To header is set per recipient)
+            recipient_emails: Recipient email addresses
             
-            # Send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
+        Returns:
+            Recipients the server refused
+        """
+        failed = []
+        if self.smtp_port == 465:
+            server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port)
+        else:
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        
+        with server:
+            if self.smtp_port != 465:
                 server.starttls()
-                server.login(self.sender_email, self.sender_password)
-                server.send_message(msg)
-            
-            logger.info(f"Email sent successfully to: {recipient_email}")
-            return True
+            server.login(self.sender_email, self.sender_password)
             
-        except Exception as e:
-            logger.error(f"Failed to send email: {e}")
-            return False
+            for email in recipient_emails:
+                del msg['To']
+                msg['To'] = email
+                try:
+                    server.send_message(msg)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError) as e:
+                    logger.error(f"Failed to send email to {email}: {e}")
+                    failed.append(email)
+        
+        return failed
     
     def _attach_file(self, msg: MIMEMultipart, file_path: str) -> None:
-        """Attach a file to the email message."""
+        """Attach a file to the email message.
+        
+        The file is memory-mapped and base64-encoded straight from the page
+        cache, so only the encoded copy is held in memory.
+        """
         try:
             file_path = Path(file_path)
             
-            with open(file_path, 'rb') as f:
-                part = MIMEBase('application', 'octet-stream')
-                part.set_payload(f.read())
+            size = os.stat(file_path).st_size
+            if size > MAX_ATTACHMENT_BYTES:
+                logger.warning(
+                    f"Not attaching {file_path.name}: {size} bytes exceeds {MAX_ATTACHMENT_BYTES}"
+                )
+                return
             
-            encoders.encode_base64(part)
+            part = MIMEBase('application', 'octet-stream')
+            if size:
+                with open(file_path, 'rb') as f, \
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    part.set_payload(base64.encodebytes(mm).decode('ascii'))
+            else:
+                part.set_payload('')
+            part['Content-Transfer-Encoding'] = 'base64'
             part.add_header(
                 'Content-Disposition',
                 f'attachment; filename="{file_path.name}"'
@@ -156,6 +235,21 @@ Ministère de la Santé - République Tunisienne
         except Exception as e:
             logger.error(f"Failed to attach file {file_path}: {e}")
     
+    def _attach_bytes(self, msg: MIMEMultipart, data: bytes, filename: str) -> None:
+        """Attach in-memory content to the email message."""
+        if len(data) > MAX_ATTACHMENT_BYTES:
+            logger.warning(f"Not attaching {filename}: {len(data)} bytes exceeds {MAX_ATTACHMENT_BYTES}")
+            return
+        
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(base64.encodebytes(data).decode('ascii'))
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.add_header(
+            'Content-Disposition',
+            f'attachment; filename="{filename}"'
+        )
+        msg.attach(part)
+    
     def send_emergency_alert(
         self,
         recipient_emails: List[str],
@@ -179,9 +273,22 @@ Ministère de la Santé - République Tunisienne
         if location:
             subject += f" - {location}"
         
-        success = True
-        for email in recipient_emails:
-            if not self.send_report(email, report_path, subject=subject):
-                success = False
+        if not self.is_configured():
+            logger.error("Email credentials not configured")
+            return False
+        
+        if not recipient_emails:
+            return True
         
-        return success
+        try:
+            # The alert is identical for everyone: build it once, send it
+            # over one SMTP session
+            msg = self._build_message(recipient_emails[0], report_path, subject=subject)
+            failed = self._send_many(msg, recipient_emails)
+            
+            logger.info(f"Emergency alert sent to {len(recipient_emails) - len(failed)}/{len(recipient_emails)} recipients")
+            return not failed
+            
+        except Exception as e:
+            logger.error(f"Failed to send emergency alert: {e}")
+            return False
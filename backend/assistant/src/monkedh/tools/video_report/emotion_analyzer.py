@@ -5,12 +5,99 @@ Analyzes emotional content from audio transcriptions
 
 import logging
 import os
+import re
 import base64
-from typing import Dict, List, Any, Optional
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Tuple
 from pathlib import Path
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
+# Emotion keywords for the text fallback
+EMOTIONS_KEYWORDS = {
+    "urgence": ["urgent", "urgence", "danger", "aide", "secours", "appel", "emergency"],
+    "panique": ["panique", "peur", "terreur", "horrifié", "choc"],
+    "calme": ["calme", "tranquille", "serein", "cool", "relaxe"],
+    "determiné": ["décidé", "determiné", "résolu", "volonté"],
+    "empathie": ["merci", "s'il vous plaît", "svp", "aide", "assistance", "comprendre"],
+    "confusion": ["quoi", "pourquoi", "comment", "confus", "problème", "erreur"]
+}
+
+# Keyword -> emotions it counts towards (a keyword may feed several)
+_KEYWORD_EMOTIONS: Dict[str, Tuple[str, ...]] = {}
+for _emotion, _keywords in EMOTIONS_KEYWORDS.items():
+    for _keyword in _keywords:
+        _KEYWORD_EMOTIONS[_keyword] = _KEYWORD_EMOTIONS.get(_keyword, ()) + (_emotion,)
+
+# All keywords are matched in one pass over the text: an Aho-Corasick
+# automaton when pyahocorasick is installed, else a lookahead regex that
+# also reports overlapping matches ("erreur" inside "terreur")
+try:
+    import ahocorasick
+    _AUTOMATON = ahocorasick.Automaton()
+    for _keyword in _KEYWORD_EMOTIONS:
+        _AUTOMATON.add_word(_keyword, _keyword)
+    _AUTOMATON.make_automaton()
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+    _KEYWORD_RE = re.compile(
+        "(?=(" + "|".join(map(re.escape, sorted(_KEYWORD_EMOTIONS, key=len, reverse=True))) + "))"
+    )
+
+
+def _emotion_counts(text_lower: str) -> Counter:
+    """Number of distinct keywords of each emotion found in a lower-cased text."""
+    if AHOCORASICK_AVAILABLE:
+        found = {keyword for _, keyword in _AUTOMATON.iter(text_lower)}
+    else:
+        found = set(_KEYWORD_RE.findall(text_lower))
+    
+    counts = Counter()
+    for keyword in found:
+        counts.update(_KEYWORD_EMOTIONS[keyword])
+    return counts
+
+
+@lru_cache(maxsize=1024)
+def _keyword_emotions(text: str) -> Tuple[Tuple[str, float], ...]:
+    """
+    Keyword-based emotion scores for a text, sorted by score.
+    
+    Scoring is deterministic, so results are memoized per text; repeated
+    phrases in a transcript are only scored once.
+    
+    Args:
+        text: Transcribed text
+        
+    Returns:
+        Tuple of (emotion, score) pairs
+    """
+    text_lower = text.lower() if text else ""
+    counts = _emotion_counts(text_lower)
+    emotion_scores = {}
+    
+    # Score keyword matches
+    for emotion in EMOTIONS_KEYWORDS:
+        emotion_scores[emotion] = min(0.1 + (counts[emotion] * 0.15), 0.95)  # Cap at 0.95
+    
+    # Normalize scores
+    total_score = sum(emotion_scores.values())
+    if total_score > 0:
+        emotion_scores = {e: s/total_score for e, s in emotion_scores.items()}
+    else:
+        emotion_scores = {e: 1/len(EMOTIONS_KEYWORDS) for e in EMOTIONS_KEYWORDS}
+    
+    # Sorted by score
+    return tuple(
+        (emotion, score)
+        for emotion, score in sorted(emotion_scores.items(), key=lambda x: x[1], reverse=True)
+        if score > 0.05  # Only include emotions with meaningful scores
+    )
+
 
 class SimpleEmotionAnalyzer:
     """
@@ -35,36 +122,10 @@ class SimpleEmotionAnalyzer:
         Returns:
             List of emotions with confidence scores
         """
-        # Define emotion keywords
-        emotions_keywords = {
-            "urgence": ["urgent", "urgence", "danger", "aide", "secours", "appel", "emergency"],
-            "panique": ["panique", "peur", "terreur", "horrifié", "choc"],
-            "calme": ["calme", "tranquille", "serein", "cool", "relaxe"],
-            "determiné": ["décidé", "determiné", "résolu", "volonté"],
-            "empathie": ["merci", "s'il vous plaît", "svp", "aide", "assistance", "comprendre"],
-            "confusion": ["quoi", "pourquoi", "comment", "confus", "problème", "erreur"]
-        }
-        
-        text_lower = text.lower() if text else ""
-        emotion_scores = {}
-        
-        # Count keyword matches
-        for emotion, keywords in emotions_keywords.items():
-            count = sum(1 for keyword in keywords if keyword in text_lower)
-            emotion_scores[emotion] = min(0.1 + (count * 0.15), 0.95)  # Cap at 0.95
-        
-        # Normalize scores
-        total_score = sum(emotion_scores.values())
-        if total_score > 0:
-            emotion_scores = {e: s/total_score for e, s in emotion_scores.items()}
-        else:
-            emotion_scores = {e: 1/len(emotions_keywords) for e in emotions_keywords}
-        
-        # Return as list sorted by score
+        # Fresh dicts per call so callers can't mutate the memoized scores
         return [
             {"name": emotion, "score": score}
-            for emotion, score in sorted(emotion_scores.items(), key=lambda x: x[1], reverse=True)
-            if score > 0.05  # Only include emotions with meaningful scores
+            for emotion, score in _keyword_emotions(text or "")
         ]
     
     def analyze_text(self, text: str) -> List[Dict[str, Any]]:
@@ -96,25 +157,40 @@ class SimpleEmotionAnalyzer:
         Returns:
             List of emotion analysis results
         """
-        results = []
+        texts = [segment.get('text', '') or '' for segment in segments]
+        rows = [i for i, text in enumerate(texts) if text]
+        if not rows:
+            return []
         
-        for segment in segments:
-            try:
-                text = segment.get('text', '')
-                start_time = segment.get('start_time', 0)
-                end_time = segment.get('end_time', 0)
-                
-                emotions = self.analyze_text(text)
-                
-                if emotions:
-                    results.append({
-                        "start_time": start_time,
-                        "end_time": end_time,
-                        "text": text,
-                        "emotions": emotions
-                    })
-            except Exception as e:
-                logger.error(f"Error analyzing segment: {e}")
+        # Keyword counts for all segments as one (segments x emotions) matrix
+        emotion_names = list(EMOTIONS_KEYWORDS)
+        emotion_index = {name: j for j, name in enumerate(emotion_names)}
+        counts = np.zeros((len(rows), len(emotion_names)), dtype=np.int32)
+        for r, i in enumerate(rows):
+            for emotion, count in _emotion_counts(texts[i].lower()).items():
+                counts[r, emotion_index[emotion]] = count
+        
+        # Same scoring as the single-text path, for every segment at once
+        scores = 0.1 + counts * 0.15
+        np.minimum(scores, 0.95, out=scores)  # Cap at 0.95
+        scores /= scores.sum(axis=1, keepdims=True)
+        order = np.argsort(-scores, axis=1, kind="stable")
+        
+        results = []
+        for r, i in enumerate(rows):
+            segment = segments[i]
+            row_scores = scores[r]
+            results.append({
+                "start_time": segment.get('start_time', 0),
+                "end_time": segment.get('end_time', 0),
+                "text": texts[i],
+                "emotions": [
+                    {"name": emotion_names[j], "score": float(row_scores[j])}
+                    for j in order[r]
+                    if row_scores[j] > 0.05  # Only include emotions with meaningful scores
+                ]
+            })
         
+        logger.info(f"✓ Emotion analysis complete for {len(results)} segments")
         return results
 
@@ -1,19 +1,232 @@
 """Video frame extraction utility using OpenCV."""
 import os
+import time
+import shutil
 import logging
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 import cv2
+import numpy as np
+
+try:
+    import decord
+    DECORD_AVAILABLE = True
+except ImportError:
+    DECORD_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# Decode, JPEG encode and disk writes run as overlapping pipeline stages
+# (OpenCV, libjpeg and file I/O all release the GIL). Bounded queues cap the
+# number of raw frames held in memory
+JPEG_ENCODE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+PIPELINE_QUEUE_SIZE = 8
+
+# Quality 75 is indistinguishable to the vision model; single-pass baseline encoding
+JPEG_PARAMS = [
+    cv2.IMWRITE_JPEG_QUALITY, 75,
+    cv2.IMWRITE_JPEG_PROGRESSIVE, 0,
+    cv2.IMWRITE_JPEG_OPTIMIZE, 0,
+]
+
+# Longest side of saved frames; vision models downscale larger inputs anyway
+FRAME_MAX_SIDE = 1024
+
+# Above this many frames between samples, seeking beats decoding through
+SEEK_MIN_INTERVAL = 48
+
+# Frames decoded per decord batch (bounds memory on long videos)
+DECORD_BATCH_SIZE = 32
+
+# dHashes of the frames written by extract_frames, by path, so the vision
+# step can deduplicate them without reading the JPEGs back
+_FRAME_HASHES_MAX = 4096
+_frame_hashes: "OrderedDict[str, Tuple[int, bytes]]" = OrderedDict()
+_frame_hashes_lock = threading.Lock()
+
+
+@lru_cache(maxsize=32)
+def _probe_file(path: str, mtime_ns: int, size: int) -> Dict[str, Any]:
+    """Open a video once and read its container properties (cached per file version).
+    
+    Also probes for an audio track, so callers that check it repeatedly
+    (get_video_info, the crew) do not spawn ffmpeg every time.
+    """
+    from .audio_analyzer import has_audio_stream
+    
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video file: {path}")
+    
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        return {
+            "fps": fps,
+            "total_frames": total_frames,
+            "duration": total_frames / fps if fps > 0 else 0,
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "has_audio": has_audio_stream(path)
+        }
+    finally:
+        cap.release()
+
+
+def _probe(video_path: str) -> Dict[str, Any]:
+    """Video properties, shared by get_video_info and extract_frames.
+    
+    The cache key includes mtime and size, so a file replaced at the same
+    path is probed again.
+    """
+    try:
+        st = os.stat(video_path)
+    except OSError:
+        raise RuntimeError(f"Cannot open video file: {video_path}")
+    return dict(_probe_file(os.path.abspath(video_path), st.st_mtime_ns, st.st_size))
+
+
+def _iter_frames_decord(
+    video_path: str,
+    frame_interval: int
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Decode only the sampled frame indices with decord's threaded decoder."""
+    vr = decord.VideoReader(video_path, num_threads=os.cpu_count() or 1)
+    indices = list(range(0, len(vr), frame_interval))
+    for start in range(0, len(indices), DECORD_BATCH_SIZE):
+        batch_indices = indices[start:start + DECORD_BATCH_SIZE]
+        batch = vr.get_batch(batch_indices).asnumpy()
+        for frame_idx, rgb in zip(batch_indices, batch):
+            yield frame_idx, cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+
+def _iter_frames_opencv(
+    cap: cv2.VideoCapture,
+    frame_interval: int
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yield every frame_interval-th frame without fully decoding the others.
+    
+    Long intervals seek straight to the target index; short ones grab()
+    through the skipped frames, which avoids the retrieve/convert step.
+    """
+    frame_idx = 0
+    seek = frame_interval >= SEEK_MIN_INTERVAL
+    while True:
+        if seek:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame_idx, frame
+        
+        if not seek:
+            for _ in range(frame_interval - 1):
+                if not cap.grab():
+                    return
+        frame_idx += frame_interval
+
+
+def _decode_worker(
+    frame_iter: Iterator[Tuple[int, np.ndarray]],
+    q_raw: queue.Queue,
+    n_encoders: int
+) -> None:
+    """Pipeline stage 1: push (seq, frame_idx, frame) for each sampled frame."""
+    try:
+        for seq, (frame_idx, frame) in enumerate(frame_iter):
+            q_raw.put((seq, frame_idx, frame))
+    finally:
+        for _ in range(n_encoders):
+            q_raw.put(None)
+
+
+def _encode_frame(frame: np.ndarray, scale: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Downscale a frame by scale (when < 1) and JPEG-encode it.
+    
+    Returns:
+        (resized_frame, jpeg_buffer)
+    """
+    if scale < 1.0:
+        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ok, jpeg = cv2.imencode(".jpg", frame, JPEG_PARAMS)
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    return frame, jpeg
+
+
+def _encode_worker(
+    q_raw: queue.Queue,
+    q_enc: queue.Queue,
+    scale: float
+) -> Dict[int, bytes]:
+    """Pipeline stage 2: resize, JPEG-encode and hash frames.
+    
+    Returns:
+        dHash of every frame this worker encoded, by sequence number
+    """
+    hashes = {}
+    try:
+        while (item := q_raw.get()) is not None:
+            seq, frame_idx, frame = item
+            try:
+                frame, jpeg = _encode_frame(frame, scale)
+                hashes[seq] = compute_dhash(frame)
+                q_enc.put((seq, frame_idx, jpeg))
+            except Exception as e:
+                logger.error(f"Failed to encode frame {frame_idx}: {e}")
+    finally:
+        q_enc.put(None)
+    return hashes
+
+
+def _write_worker(
+    q_enc: queue.Queue,
+    n_encoders: int,
+    frame_path_for: Callable[[int, int], Tuple[str, float]]
+) -> Dict[int, Tuple[str, float]]:
+    """Pipeline stage 3: flush encoded JPEGs to disk.
+    
+    Returns:
+        (frame_path, timestamp) of every written frame, by sequence number
+    """
+    written = {}
+    remaining = n_encoders
+    while remaining:
+        item = q_enc.get()
+        if item is None:
+            remaining -= 1
+            continue
+        # Any failure only skips this frame: the writer must keep draining
+        # until every encoder has finished, or they block on a full queue
+        seq, frame_idx, jpeg = item
+        try:
+            frame_path, timestamp = frame_path_for(seq, frame_idx)
+            with open(frame_path, "wb") as f:
+                f.write(jpeg)
+            written[seq] = (frame_path, timestamp)
+            logger.info(f"Saved frame {seq + 1}: {Path(frame_path).name}")
+        except Exception as e:
+            logger.error(f"Failed to write frame {seq + 1}: {e}")
+    return written
+
+
+def _remove_dirs(paths: List[Path]) -> None:
+    """Delete directories, ignoring errors (another run may be deleting them too)."""
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
+
 
 def extract_frames(
     video_path: str,
     every_n_seconds: float = 2.0,
     output_dir: str = None
-) -> List[str]:
+) -> List[Tuple[str, float, bytes]]:
     """Extract frames from video at specified interval.
     
     Args:
@@ -22,7 +235,7 @@ def extract_frames(
         output_dir: Directory to save extracted frames (defaults to output/frames)
         
     Returns:
-        List of paths to extracted frame images
+        List of (frame_path, timestamp_seconds, dhash) tuples for extracted frames
     """
     logger.info(f"Extracting frames from: {video_path}")
     logger.info(f"Sampling rate: 1 frame every {every_n_seconds} seconds")
@@ -31,26 +244,29 @@ def extract_frames(
     if output_dir is None:
         output_dir = Path(__file__).parent / "output" / "frames"
     
-    # Create output directory
+    # Swap out a directory holding previous frames with one atomic rename
+    # and delete it in the background, so extraction starts immediately
     output_path = Path(output_dir)
-    output_path.mkdir(parents=True, exist_ok=True)
+    if next(output_path.glob("frame_*.jpg"), None) is not None:
+        old_path = output_path.with_name(f"{output_path.name}.old.{time.time_ns()}")
+        output_path.rename(old_path)
+    # The sweep also covers old directories left by an exit mid-deletion
+    old_paths = list(output_path.parent.glob(f"{output_path.name}.old.*"))
+    if old_paths:
+        threading.Thread(target=_remove_dirs, args=(old_paths,), daemon=True).start()
     
-    # Clear existing frames
-    for existing_file in output_path.glob("frame_*.jpg"):
-        try:
-            existing_file.unlink()
-        except Exception:
-            pass
-    
-    # Open video
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise RuntimeError(f"Cannot open video file: {video_path}")
+    # Create output directory
+    output_path.mkdir(parents=True, exist_ok=True)
     
-    # Get video properties
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration = total_frames / fps if fps > 0 else 0
+    # Get video properties (cached when get_video_info already probed the file)
+    info = _probe(video_path)
+    fps = info["fps"]
+    total_frames = info["total_frames"]
+    width = info["width"]
+    height = info["height"]
+    duration = info["duration"]
+    if fps <= 0:
+        raise RuntimeError(f"Cannot read frame rate of video file: {video_path}")
     
     logger.info(f"Video properties: {fps:.2f} FPS, {total_frames} frames, {duration:.2f}s duration")
     
@@ -59,63 +275,244 @@ def extract_frames(
     if frame_interval < 1:
         frame_interval = 1
     
-    frame_paths = []
-    frame_count = 0
-    saved_count = 0
+    def frame_path_for(seq: int, frame_idx: int) -> Tuple[str, float]:
+        timestamp = frame_idx / fps
+        return str(output_path / f"frame_{seq:04d}_t{timestamp:.2f}s.jpg"), timestamp
     
+    # Only the OpenCV decode path needs a capture; decord opens its own reader
+    cap = None
     try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Save frame at interval
-            if frame_count % frame_interval == 0:
-                timestamp = frame_count / fps
-                frame_filename = f"frame_{saved_count:04d}_t{timestamp:.2f}s.jpg"
-                frame_path = output_path / frame_filename
-                
-                cv2.imwrite(str(frame_path), frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
-                frame_paths.append(str(frame_path))
-                
-                logger.info(f"Saved frame {saved_count + 1}: {frame_filename}")
-                saved_count += 1
+        if DECORD_AVAILABLE:
+            frame_iter = _iter_frames_decord(video_path, frame_interval)
+        else:
+            cap = cv2.VideoCapture(video_path)
+            if not cap.isOpened():
+                raise RuntimeError(f"Cannot open video file: {video_path}")
+            frame_iter = _iter_frames_opencv(cap, frame_interval)
+        
+        scale = FRAME_MAX_SIDE / max(width, height) if max(width, height) > FRAME_MAX_SIDE else 1.0
+        
+        # decode -> q_raw -> N encoders -> q_enc -> writer
+        q_raw = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        q_enc = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        n_encoders = JPEG_ENCODE_WORKERS
+        with ThreadPoolExecutor(max_workers=n_encoders + 2) as pool:
+            decoder = pool.submit(_decode_worker, frame_iter, q_raw, n_encoders)
+            encoders = [pool.submit(_encode_worker, q_raw, q_enc, scale) for _ in range(n_encoders)]
+            writer = pool.submit(_write_worker, q_enc, n_encoders, frame_path_for)
             
-            frame_count += 1
+            written = writer.result()
+            hashes = {}
+            for encoder in encoders:
+                hashes.update(encoder.result())
+            decoder.result()
     
     finally:
-        cap.release()
+        if cap is not None:
+            cap.release()
+    
+    frames = [
+        (frame_path, timestamp, hashes[seq])
+        for seq, (frame_path, timestamp) in sorted(written.items())
+    ]
+    
+    _remember_frame_hashes(frames)
     
-    logger.info(f"Extraction complete: {saved_count} frames saved to {output_dir}")
-    return frame_paths
+    logger.info(f"Extraction complete: {len(frames)} frames saved to {output_dir}")
+    return frames
 
 
-def get_video_info(video_path: str) -> dict:
-    """Get video metadata.
+def iter_frames(
+    video_path: str,
+    every_n_seconds: float = 2.0,
+    save_dir: str = None
+) -> Iterator[Tuple[str, float, bytes]]:
+    """Stream sampled frames as in-memory JPEGs, without a disk round-trip.
+    
+    Each frame is yielded as soon as it is encoded, so a consumer can start
+    analyzing frame k while frame k+1 is being decoded.
     
     Args:
-        video_path: Path to video file
+        video_path: Path to input video file
+        every_n_seconds: Yield one frame every N seconds
+        save_dir: Optionally also write the JPEGs here (for debugging)
         
-    Returns:
-        Dict with fps, total_frames, duration, width, height
+    Yields:
+        (frame_name, timestamp_seconds, jpeg_bytes) tuples
     """
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise RuntimeError(f"Cannot open video file: {video_path}")
+    info = _probe(video_path)
+    fps = info["fps"]
+    if fps <= 0:
+        raise RuntimeError(f"Cannot read frame rate of video file: {video_path}")
+    frame_interval = max(1, int(fps * every_n_seconds))
+    longest = max(info["width"], info["height"])
+    scale = FRAME_MAX_SIDE / longest if longest > FRAME_MAX_SIDE else 1.0
+    
+    save_path = Path(save_dir) if save_dir else None
+    if save_path is not None:
+        save_path.mkdir(parents=True, exist_ok=True)
     
+    cap = None
     try:
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        duration = total_frames / fps if fps > 0 else 0
+        if DECORD_AVAILABLE:
+            frame_iter = _iter_frames_decord(video_path, frame_interval)
+        else:
+            cap = cv2.VideoCapture(video_path)
+            if not cap.isOpened():
+                raise RuntimeError(f"Cannot open video file: {video_path}")
+            frame_iter = _iter_frames_opencv(cap, frame_interval)
         
-        return {
-            "fps": fps,
-            "total_frames": total_frames,
-            "duration": duration,
-            "width": width,
-            "height": height
-        }
+        for seq, (frame_idx, frame) in enumerate(frame_iter):
+            try:
+                _, jpeg = _encode_frame(frame, scale)
+            except Exception as e:
+                logger.error(f"Failed to encode frame {frame_idx}: {e}")
+                continue
+            
+            timestamp = frame_idx / fps
+            frame_name = f"frame_{seq:04d}_t{timestamp:.2f}s.jpg"
+            jpeg_bytes = jpeg.tobytes()
+            if save_path is not None:
+                with open(save_path / frame_name, "wb") as f:
+                    f.write(jpeg_bytes)
+            yield frame_name, timestamp, jpeg_bytes
     finally:
-        cap.release()
+        if cap is not None:
+            cap.release()
+
+
+def compute_dhash(frame: np.ndarray) -> bytes:
+    """Compute a 64-bit difference hash (dHash) of a BGR frame.
+    
+    Args:
+        frame: Decoded BGR frame
+        
+    Returns:
+        8-byte perceptual hash
+    """
+    small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (9, 8), interpolation=cv2.INTER_AREA)
+    diff = small[:, 1:] > small[:, :-1]
+    return np.packbits(diff).tobytes()
+
+
+def _remember_frame_hashes(frames: List[Tuple[str, float, bytes]]) -> None:
+    """Record the dHashes of freshly written frames (see extracted_frame_hashes)."""
+    entries = []
+    for frame_path, _, frame_hash in frames:
+        try:
+            entries.append((frame_path, os.stat(frame_path).st_mtime_ns, frame_hash))
+        except OSError:
+            continue
+    with _frame_hashes_lock:
+        for frame_path, mtime_ns, frame_hash in entries:
+            _frame_hashes[frame_path] = (mtime_ns, frame_hash)
+            _frame_hashes.move_to_end(frame_path)
+        while len(_frame_hashes) > _FRAME_HASHES_MAX:
+            _frame_hashes.popitem(last=False)
+
+
+def extracted_frame_hashes(frame_paths: List[str]) -> Optional[List[bytes]]:
+    """dHashes computed by extract_frames for these frame files.
+    
+    Args:
+        frame_paths: Frame image paths as returned by extract_frames
+        
+    Returns:
+        One hash per path, or None if any frame was not extracted by this
+        process or has been rewritten since
+    """
+    hashes = []
+    for frame_path in frame_paths:
+        with _frame_hashes_lock:
+            entry = _frame_hashes.get(frame_path)
+        if entry is None:
+            return None
+        try:
+            if os.stat(frame_path).st_mtime_ns != entry[0]:
+                return None
+        except OSError:
+            return None
+        hashes.append(entry[1])
+    return hashes
+
+
+def hash_frame_file(frame_path: str) -> Optional[bytes]:
+    """dHash of a saved frame image, or None if it cannot be read."""
+    frame = cv2.imread(frame_path, cv2.IMREAD_REDUCED_COLOR_4)
+    if frame is None:
+        return None
+    return compute_dhash(frame)
+
+
+def cluster_similar_frames(
+    hashes: List[Optional[bytes]],
+    threshold: int = 10
+) -> List[int]:
+    """Group near-duplicate frames anywhere in the video.
+    
+    Greedy: each frame joins the first cluster whose representative (its
+    first frame) is within the Hamming distance threshold, otherwise it
+    starts a new cluster. Unlike skip_similar_frames this also matches
+    scenes that come back later in the video.
+    
+    Args:
+        hashes: dHash per frame (None for frames that could not be hashed)
+        threshold: Maximum Hamming distance between dHashes of duplicates
+        
+    Returns:
+        Index of the representative frame for every frame
+    """
+    centers = []
+    representatives = []
+    for i, frame_hash in enumerate(hashes):
+        if frame_hash is None:
+            representatives.append(i)
+            continue
+        value = int.from_bytes(frame_hash, "big")
+        for center, rep in centers:
+            if (value ^ center).bit_count() <= threshold:
+                representatives.append(rep)
+                break
+        else:
+            centers.append((value, i))
+            representatives.append(i)
+    return representatives
+
+
+def skip_similar_frames(
+    frames: List[Tuple[str, float, bytes]],
+    threshold: int = 10
+) -> List[Tuple[str, float, bytes]]:
+    """Drop frames that are near-duplicates of the last kept frame.
+    
+    Args:
+        frames: Frames as returned by extract_frames
+        threshold: Minimum Hamming distance between dHashes to keep a frame
+        
+    Returns:
+        Frames whose hash differs enough from the previously kept frame
+    """
+    kept = []
+    last_hash = None
+    for frame in frames:
+        frame_hash = int.from_bytes(frame[2], "big")
+        if last_hash is None or bin(frame_hash ^ last_hash).count("1") > threshold:
+            kept.append(frame)
+            last_hash = frame_hash
+    
+    if len(kept) < len(frames):
+        logger.info(f"Skipped {len(frames) - len(kept)} near-duplicate frames ({len(kept)} kept)")
+    return kept
+
+
+def get_video_info(video_path: str) -> dict:
+    """Get video metadata.
+    
+    Args:
+        video_path: Path to video file
+        
+    Returns:
+        Dict with fps, total_frames, duration, width, height and has_audio
+        (None when the audio track could not be probed)
+    """
+    return _probe(video_path)
@@ -0,0 +1,112 @@
+"""Per-video pipeline state so reruns skip work that already completed."""
+import os
+import json
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# One JSON state file per video, keyed by the SHA-256 of its content
+PIPELINE_STATE_DIR = Path(os.getenv("PIPELINE_STATE_DIR", "output/state"))
+
+# Read size when fingerprinting videos
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def video_fingerprint(video_path: str) -> str:
+    """SHA-256 of a video file, hashed in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(video_path, "rb") as f:
+        while block := f.read(_HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_complete_audio_result(result: Optional[Dict[str, Any]]) -> bool:
+    """Whether an audio analysis has a transcription and no failed phase."""
+    return bool(result) and bool(result.get("transcription")) and not result.get("error")
+
+
+class PipelineState:
+    """Completed pipeline results for one video.
+    
+    Records the audio analysis (per transcription language) and the last
+    generated report, so a rerun after a crash (e.g. during report
+    generation) does not redo them. Per-frame vision results are already
+    resumable through the frame analysis cache.
+    """
+    
+    def __init__(self, video_hash: str, state_dir: Path = PIPELINE_STATE_DIR):
+        self.video_hash = video_hash
+        self.path = Path(state_dir) / f"{video_hash}.json"
+        self.audio_results: Dict[str, Dict[str, Any]] = {}
+        self.report_path: Optional[str] = None
+        self.html_path: Optional[str] = None
+    
+    @classmethod
+    def load(cls, video_hash: str, state_dir: Path = PIPELINE_STATE_DIR) -> "PipelineState":
+        """Load the state of a video, or an empty state if none is stored."""
+        state = cls(video_hash, state_dir)
+        try:
+            with open(state.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            state.audio_results = data.get("audio_results", {})
+            state.report_path = data.get("report_path")
+            state.html_path = data.get("html_path")
+            logger.info(f"✓ Pipeline state loaded: {state.path}")
+        except (OSError, ValueError, AttributeError):
+            pass
+        return state
+    
+    @classmethod
+    def for_video(cls, video_path: str, state_dir: Path = PIPELINE_STATE_DIR) -> "PipelineState":
+        """Load the state of a video file, fingerprinting its content."""
+        return cls.load(video_fingerprint(video_path), state_dir)
+    
+    def has_audio_result(self, language: str) -> bool:
+        """Whether a complete audio analysis is recorded for this language."""
+        return is_complete_audio_result(self.audio_results.get(language))
+    
+    def set_audio_result(self, language: str, result: Optional[Dict[str, Any]]) -> bool:
+        """Record an audio analysis result and save, if it is complete.
+        
+        Partial results (no transcription, or a phase that failed) are not
+        recorded, so the next run retries the analysis.
+        
+        Returns:
+            Whether the result was recorded
+        """
+        if not is_complete_audio_result(result):
+            return False
+        self.audio_results[language] = result
+        self.save()
+        return True
+    
+    def set_report(self, report_path: str, html_path: Optional[str] = None) -> None:
+        """Record the generated report files and save."""
+        self.report_path = str(report_path)
+        self.html_path = str(html_path) if html_path else None
+        self.save()
+    
+    def save(self) -> None:
+        """Persist the state atomically; state failures are never fatal."""
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "video_hash": self.video_hash,
+                    "audio_results": self.audio_results,
+                    "report_path": self.report_path,
+                    "html_path": self.html_path
+                }, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not save pipeline state: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
@@ -1,52 +1,58 @@
 """Enhanced report formatting with HTML support."""
 import logging
+import os
+import string
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
-from typing import Optional
+from typing import IO, Dict, Iterator, Optional, Union
 import markdown
 
+try:
+    import cmarkgfm
+    from cmarkgfm.cmark import Options as cmarkgfmOptions
+    CMARKGFM_AVAILABLE = True
+except ImportError:
+    CMARKGFM_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
 
-HTML_TEMPLATE = """<!DOCTYPE html>
-<html lang="{lang}">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Rapport d'Analyse Vidéo - Monkedh</title>
-    <style>
-        * {{
+REPORT_CSS = """
+        * {
             margin: 0;
             padding: 0;
             box-sizing: border-box;
-        }}
+        }
         
-        body {{
+        body {
             font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
             line-height: 1.6;
             color: #333;
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             padding: 20px;
-        }}
+        }
         
-        .container {{
+        .container {
             max-width: 1200px;
             margin: 0 auto;
             background: white;
             box-shadow: 0 10px 50px rgba(0, 0, 0, 0.3);
             border-radius: 12px;
             overflow: hidden;
-        }}
+        }
         
-        .header {{
+        .header {
             background: linear-gradient(135deg, #1e3c72 0%, #2a5298 100%);
             color: white;
             padding: 40px;
             text-align: center;
             position: relative;
-        }}
+        }
         
-        .header::after {{
+        .header::after {
             content: '';
             position: absolute;
             bottom: 0;
@@ -54,46 +60,46 @@ HTML_TEMPLATE = """<!DOCTYPE html>
             right: 0;
             height: 4px;
             background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
-        }}
+        }
         
-        .header h1 {{
+        .header h1 {
             font-size: 2.5rem;
             margin-bottom: 10px;
             font-weight: 700;
             text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.3);
-        }}
+        }
         
-        .header .subtitle {{
+        .header .subtitle {
             font-size: 1.2rem;
             opacity: 0.95;
             font-weight: 300;
-        }}
+        }
         
-        .header .org {{
+        .header .org {
             margin-top: 15px;
             font-size: 1rem;
             opacity: 0.9;
             border-top: 1px solid rgba(255, 255, 255, 0.3);
             padding-top: 15px;
             font-weight: 500;
-        }}
+        }
         
-        .metadata {{
+        .metadata {
             background: #f8f9fa;
             padding: 20px 40px;
             border-bottom: 1px solid #e0e0e0;
             display: flex;
             justify-content: space-around;
             flex-wrap: wrap;
-        }}
+        }
         
-        .metadata-item {{
+        .metadata-item {
             display: flex;
             align-items: center;
             margin: 10px 20px;
-        }}
+        }
         
-        .metadata-icon {{
+        .metadata-icon {
             width: 40px;
             height: 40px;
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
@@ -105,55 +111,55 @@ HTML_TEMPLATE = """<!DOCTYPE html>
             font-weight: bold;
             margin-right: 12px;
             font-size: 1.2rem;
-        }}
+        }
         
-        .metadata-content {{
+        .metadata-content {
             display: flex;
             flex-direction: column;
-        }}
+        }
         
-        .metadata-label {{
+        .metadata-label {
             font-size: 0.85rem;
             color: #666;
             font-weight: 600;
-        }}
+        }
         
-        .metadata-value {{
+        .metadata-value {
             font-size: 1.1rem;
             color: #333;
             font-weight: 700;
-        }}
+        }
         
-        .content {{
+        .content {
             padding: 40px;
-        }}
+        }
         
-        .section {{
+        .section {
             margin-bottom: 40px;
             animation: fadeIn 0.5s ease-in;
-        }}
+        }
         
-        @keyframes fadeIn {{
-            from {{ opacity: 0; transform: translateY(20px); }}
-            to {{ opacity: 1; transform: translateY(0); }}
-        }}
+        @keyframes fadeIn {
+            from { opacity: 0; transform: translateY(20px); }
+            to { opacity: 1; transform: translateY(0); }
+        }
         
-        h1 {{
+        h1 {
             color: #1e3c72;
             font-size: 2.2rem;
             margin-bottom: 20px;
-        }}
+        }
         
-        h2 {{
+        h2 {
             color: #1e3c72;
             font-size: 1.8rem;
             margin-bottom: 20px;
             padding-bottom: 10px;
             border-bottom: 3px solid #667eea;
             position: relative;
-        }}
+        }
         
-        h2::before {{
+        h2::before {
             content: '';
             position: absolute;
             bottom: -3px;
@@ -161,164 +167,172 @@ HTML_TEMPLATE = """<!DOCTYPE html>
             width: 60px;
             height: 3px;
             background: #764ba2;
-        }}
+        }
         
-        h3 {{
+        h3 {
             color: #2a5298;
             font-size: 1.4rem;
             margin: 25px 0 15px;
             padding-left: 15px;
             border-left: 4px solid #667eea;
-        }}
+        }
         
-        p {{
+        p {
             margin-bottom: 15px;
             text-align: justify;
-        }}
+        }
         
-        ul {{
+        ul {
             margin: 15px 0;
             padding-left: 20px;
-        }}
+        }
         
-        li {{
+        li {
             margin-bottom: 10px;
             padding-left: 10px;
             position: relative;
             list-style: none;
-        }}
+        }
         
-        li::before {{
+        li::before {
             content: '▸';
             color: #667eea;
             font-weight: bold;
             position: absolute;
             left: -15px;
-        }}
+        }
         
-        .alert {{
+        .alert {
             padding: 20px;
             margin: 20px 0;
             border-radius: 8px;
             border-left: 5px solid;
             background: white;
             box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
-        }}
+        }
         
-        .alert-danger {{
+        .alert-danger {
             border-color: #dc3545;
             background: #fff5f5;
-        }}
+        }
         
-        .alert-warning {{
+        .alert-warning {
             border-color: #ffc107;
             background: #fffbf0;
-        }}
+        }
         
-        .alert-info {{
+        .alert-info {
             border-color: #17a2b8;
             background: #f0f9ff;
-        }}
+        }
         
-        .alert-success {{
+        .alert-success {
             border-color: #28a745;
             background: #f0fff4;
-        }}
+        }
         
-        .emergency-numbers {{
+        .emergency-numbers {
             background: linear-gradient(135deg, #dc3545 0%, #c82333 100%);
             color: white;
             padding: 25px;
             border-radius: 12px;
             margin: 30px 0;
             text-align: center;
-        }}
+        }
         
-        .emergency-numbers h4 {{
+        .emergency-numbers h4 {
             font-size: 1.4rem;
             margin-bottom: 15px;
-        }}
+        }
         
-        .emergency-numbers .numbers {{
+        .emergency-numbers .numbers {
             display: flex;
             justify-content: center;
             flex-wrap: wrap;
             gap: 20px;
-        }}
+        }
         
-        .emergency-numbers .number-item {{
+        .emergency-numbers .number-item {
             background: rgba(255, 255, 255, 0.2);
             padding: 15px 25px;
             border-radius: 8px;
-        }}
+        }
         
-        .emergency-numbers .number {{
+        .emergency-numbers .number {
             font-size: 2rem;
             font-weight: 700;
-        }}
+        }
         
-        .emergency-numbers .label {{
+        .emergency-numbers .label {
             font-size: 0.9rem;
             opacity: 0.9;
-        }}
+        }
         
-        .footer {{
+        .footer {
             background: #1e3c72;
             color: white;
             padding: 30px;
             text-align: center;
-        }}
+        }
         
-        .footer p {{
+        .footer p {
             margin: 0;
             opacity: 0.9;
-        }}
+        }
         
-        strong {{
+        strong {
             color: #1e3c72;
-        }}
+        }
         
-        em {{
+        em {
             color: #666;
             font-style: italic;
-        }}
+        }
         
-        hr {{
+        hr {
             border: none;
             height: 2px;
             background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
             margin: 30px 0;
-        }}
+        }
         
         /* RTL support for Arabic */
-        html[lang="ar"] {{
+        html[lang="ar"] {
             direction: rtl;
-        }}
+        }
         
-        html[lang="ar"] h3 {{
+        html[lang="ar"] h3 {
             padding-left: 0;
             padding-right: 15px;
             border-left: none;
             border-right: 4px solid #667eea;
-        }}
+        }
         
-        html[lang="ar"] li::before {{
+        html[lang="ar"] li::before {
             left: auto;
             right: -15px;
             content: '◂';
-        }}
+        }
         
-        @media print {{
-            body {{
+        @media print {
+            body {
                 background: white;
                 padding: 0;
-            }}
+            }
             
-            .container {{
+            .container {
                 box-shadow: none;
-            }}
-        }}
-    </style>
+            }
+        }
+"""
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="{lang}">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Rapport d'Analyse Vidéo - Monkedh</title>
+    {style}
 </head>
 <body>
     <div class="container">
@@ -381,13 +395,141 @@ HTML_TEMPLATE = """<!DOCTYPE html>
 </body>
 </html>"""
 
+# Stylesheet slot: inlined by default so reports stay self-contained when
+# emailed or served as a string, or a link to a shared report.css
+_INLINE_STYLE = "<style>" + REPORT_CSS + "    </style>"
+_LINKED_STYLE = '<link rel="stylesheet" href="report.css">'
+CSS_FILENAME = "report.css"
+
+# HTML_TEMPLATE split once into (literal, field) pairs; the CSS braces are
+# un-escaped here so rendering is a plain join with no format parsing
+_TEMPLATE_PARTS = [
+    (literal, field)
+    for literal, field, _, _ in string.Formatter().parse(HTML_TEMPLATE)
+]
+
+# Same parts with the literals pre-encoded, for rendering straight to file bytes
+_TEMPLATE_PARTS_BYTES = [
+    (literal.encode('utf-8'), field)
+    for literal, field in _TEMPLATE_PARTS
+]
+
+
+# Static, per-language template variables; only the timestamp, frame count
+# and content change between reports
+_TEMPLATE_VARS_AR = {
+    "lang": "ar",
+    "title": "تقرير تحليل حادث الفيديو",
+    "subtitle": "تحليل شامل للفيديو بالذكاء الاصطناعي",
+    "organization": "وزارة الصحة - الجمهورية التونسية",
+    "date_label": "تاريخ الإنشاء",
+    "frames_label": "الإطارات المحللة",
+    "status_label": "الحالة",
+    "status": "مكتمل",
+    "emergency_title": "أرقام الطوارئ - تونس",
+    "footer_text": "تم إنشاء هذا التقرير تلقائيًا بواسطة Monkedh"
+}
+
+_TEMPLATE_VARS_FR = {
+    "lang": "fr",
+    "title": "Rapport d'Analyse d'Incident Vidéo",
+    "subtitle": "Analyse vidéo complète par Intelligence Artificielle",
+    "organization": "Ministère de la Santé - République Tunisienne",
+    "date_label": "Date de génération",
+    "frames_label": "Frames analysées",
+    "status_label": "Statut",
+    "status": "Complet",
+    "emergency_title": "Numéros d'Urgence - Tunisie",
+    "footer_text": "Rapport généré automatiquement par Monkedh"
+}
+
+
+@contextmanager
+def open_report_file(path: Path, mode: str = 'w') -> Iterator[IO]:
+    """
+    Open a report for writing under a temporary name, renamed over ``path``
+    on success.
+    
+    Readers (e.g. the /reports static route) never see a half-written
+    report, and the file can be filled incrementally (e.g. while an LLM
+    answer streams in). On error the temporary file is removed.
+    
+    Args:
+        path: Final report path
+        mode: 'w' for UTF-8 text, 'wb' for bytes
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    encoding = None if 'b' in mode else 'utf-8'
+    try:
+        with open(tmp_path, mode, buffering=1024 * 1024, encoding=encoding) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_report_file(path: Path, content: Union[str, bytes]) -> None:
+    """Write a report atomically as UTF-8 with at most one encode and a single large write."""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    with open_report_file(path, 'wb') as f:
+        f.write(content)
+
+
+# Number of converted markdown documents kept for re-renders of the same
+# report (language toggle, retries after a failed save)
+MARKDOWN_CACHE_SIZE = 32
+
+
+@lru_cache(maxsize=MARKDOWN_CACHE_SIZE)
+def _convert_markdown(md_content: str) -> str:
+    """Markdown to HTML: C cmark-gfm when installed, else Python-Markdown.
+    
+    Both paths render GFM tables, fenced code and newlines as <br>, and pass
+    raw HTML through. Results are cached on the markdown text itself; the
+    conversion does not depend on language, frame count or timestamp, which
+    are only template variables.
+    """
+    if CMARKGFM_AVAILABLE:
+        return cmarkgfm.github_flavored_markdown_to_html(
+            md_content,
+            options=cmarkgfmOptions.CMARK_OPT_HARDBREAKS | cmarkgfmOptions.CMARK_OPT_UNSAFE
+        )
+    return markdown.markdown(
+        md_content,
+        extensions=['tables', 'fenced_code', 'nl2br']
+    )
+
+
+def _render_template(template_vars: Dict[str, str]) -> str:
+    """Render HTML_TEMPLATE from its pre-parsed parts (same output as str.format)."""
+    return "".join([
+        literal + template_vars[field] if field else literal
+        for literal, field in _TEMPLATE_PARTS
+    ])
+
+
+def _render_template_bytes(template_vars: Dict[str, str]) -> bytes:
+    """Render HTML_TEMPLATE as UTF-8 bytes, encoding only the variable values."""
+    return b"".join([
+        literal + template_vars[field].encode('utf-8') if field else literal
+        for literal, field in _TEMPLATE_PARTS_BYTES
+    ])
+
 
 def markdown_to_html(
     md_content: str,
     frames_count: int = 0,
     language: str = "français",
     output_path: Optional[str] = None,
-    full_html: bool = False
+    full_html: bool = False,
+    now: Optional[datetime] = None,
+    external_css: bool = False
 ) -> Optional[str]:
     """Convert markdown content to styled HTML report.
     
@@ -397,58 +539,27 @@ def markdown_to_html(
         language: Report language ("français" or "arabe")
         output_path: Optional path to save HTML file
         full_html: Whether to return a full HTML document (True) or just the content fragment (False)
+        now: Generation time shown in the report (defaults to the current time)
+        external_css: When saving, link a report.css written once next to the
+            file instead of inlining the stylesheet in every report
         
     Returns:
         Path to HTML file if saved, or HTML content string
     """
     # Convert markdown to HTML
-    html_content = markdown.markdown(
-        md_content,
-        extensions=['tables', 'fenced_code', 'nl2br']
-    )
+    html_content = _convert_markdown(md_content)
     
     # Prepare template variables based on language
-    generated_at = datetime.now().strftime("%d/%m/%Y %H:%M")
+    generated_at = (now or datetime.now()).strftime("%d/%m/%Y %H:%M")
     
-    if language == "arabe":
-        template_vars = {
-            "lang": "ar",
-            "title": "تقرير تحليل حادث الفيديو",
-            "subtitle": "تحليل شامل للفيديو بالذكاء الاصطناعي",
-            "organization": "وزارة الصحة - الجمهورية التونسية",
-            "date_label": "تاريخ الإنشاء",
-            "frames_label": "الإطارات المحللة",
-            "status_label": "الحالة",
-            "status": "مكتمل",
-            "emergency_title": "أرقام الطوارئ - تونس",
-            "footer_text": f"تم إنشاء هذا التقرير تلقائيًا بواسطة Monkedh - {generated_at}"
-        }
-    else:
-        template_vars = {
-            "lang": "fr",
-            "title": "Rapport d'Analyse d'Incident Vidéo",
-            "subtitle": "Analyse vidéo complète par Intelligence Artificielle",
-            "organization": "Ministère de la Santé - République Tunisienne",
-            "date_label": "Date de génération",
-            "frames_label": "Frames analysées",
-            "status_label": "Statut",
-            "status": "Complet",
-            "emergency_title": "Numéros d'Urgence - Tunisie",
-            "footer_text": f"Rapport généré automatiquement par Monkedh - {generated_at}"
-        }
+    template_vars = dict(_TEMPLATE_VARS_AR if language == "arabe" else _TEMPLATE_VARS_FR)
+    template_vars["footer_text"] = f"{template_vars['footer_text']} - {generated_at}"
     
     # Add common variables
     template_vars["generated_at"] = generated_at
     template_vars["frames_count"] = str(frames_count)
     template_vars["content"] = html_content
-    
-    # Generate final HTML or Fragment
-    if full_html:
-        final_html = HTML_TEMPLATE.format(**template_vars)
-    else:
-        # For fragment, we only return the content body, but maybe wrapped in a simple div
-        # We exclude the redundant header, metadata, and emergency numbers which the UI handles
-        final_html = f'<div class="report-content-body">{html_content}</div>'
+    template_vars["style"] = _INLINE_STYLE
     
     # Save if path provided
     if output_path:
@@ -456,10 +567,14 @@ def markdown_to_html(
             output_file = Path(output_path)
             output_file.parent.mkdir(parents=True, exist_ok=True)
             
-            # Always save full HTML for file downloads
-            full_doc = HTML_TEMPLATE.format(**template_vars)
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(full_doc)
+            if external_css:
+                css_path = output_file.parent / CSS_FILENAME
+                if not css_path.exists():
+                    write_report_file(css_path, REPORT_CSS)
+                template_vars["style"] = _LINKED_STYLE
+            
+            # Always save full HTML for file downloads, rendered straight to bytes
+            write_report_file(output_file, _render_template_bytes(template_vars))
             
             logger.info(f"HTML report saved to: {output_path}")
             return str(output_file)
@@ -468,4 +583,10 @@ def markdown_to_html(
             logger.error(f"Failed to save HTML report: {e}")
             return None
     
-    return final_html
+    # Generate final HTML or Fragment
+    if full_html:
+        return _render_template(template_vars)
+    
+    # For fragment, we only return the content body, but maybe wrapped in a simple div
+    # We exclude the redundant header, metadata, and emergency numbers which the UI handles
+    return f'<div class="report-content-body">{html_content}</div>'
@@ -1,22 +1,27 @@
 """Report generation module for video analysis."""
+import asyncio
+import os
+import re
+import mmap
+import string
 import logging
 from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Any, Tuple, Optional
 
-from .vision_client import VisionClient
-from .report_formatter import markdown_to_html
+from .vision_client import VisionClient, get_vision_client
+from .audio_analyzer import format_audio_summary
+from .report_formatter import markdown_to_html, open_report_file
 
 logger = logging.getLogger(__name__)
 
 
-CONCLUSION_PROMPT_FR = """Tu es un expert analyste d'incidents pour le Ministère de la Santé en Tunisie.
-Basé sur les descriptions frame par frame ci-dessous, crée une CONCLUSION SYNTHÉTIQUE EN FRANÇAIS.
-
-Descriptions des frames:
-{descriptions}
+# Conclusion prompts are fully static so LLM backends can reuse their
+# prefix cache across reports; the per-report data goes in a separate
+# input message (CONCLUSION_INPUT_*) sent after them
 
-{audio_section}
+CONCLUSION_PROMPT_FR = """Tu es un expert analyste d'incidents pour le Ministère de la Santé en Tunisie.
+Basé sur les descriptions frame par frame fournies dans les données d'entrée, crée une CONCLUSION SYNTHÉTIQUE EN FRANÇAIS.
 
 Génère UNIQUEMENT les sections suivantes (pas de répétition des analyses frame par frame):
 
@@ -43,7 +48,7 @@ Aperçu global (3-4 phrases) de l'incident observé dans la vidéo.
 ### ⏱️ Évolution Chronologique
 Résumé chronologique des événements clés observés.
 
-{audio_report_section}
+Si une analyse audio est fournie dans les données d'entrée, ajoute ici une section « ### 🎧 Analyse Audio » qui la résume.
 
 ## 💡 Recommandations d'Intervention
 
@@ -70,12 +75,7 @@ Sois factuel, précis et professionnel.
 
 
 SUMMARIZATION_PROMPT_AR = """أنت محلل خبير في الحوادث لوزارة الصحة في تونس. 
-بناءً على الأوصاف الإطارية أدناه، قم بإنشاء تقرير شامل للحادث بالعربية.
-
-أوصاف الإطارات:
-{descriptions}
-
-{audio_section}
+بناءً على الأوصاف الإطارية الواردة في البيانات المدخلة، قم بإنشاء تقرير شامل للحادث بالعربية.
 
 قم بإنشاء تقرير منظم بصيغة Markdown مع هذه الأقسام:
 
@@ -106,7 +106,7 @@ SUMMARIZATION_PROMPT_AR = """أنت محلل خبير في الحوادث لوز
 ### الجدول الزمني للأحداث
 وصف زمني لما حدث عبر الإطارات المحللة.
 
-{audio_report_section}
+إذا تم تقديم تحليل صوتي في البيانات المدخلة، أضف هنا قسم « ### 🎧 Analyse Audio » يلخصه.
 
 ## الاستنتاجات والتوصيات
 - ملخص خطورة الحادث
@@ -117,11 +117,94 @@ SUMMARIZATION_PROMPT_AR = """أنت محلل خبير في الحوادث لوز
 """
 
 
+CONCLUSION_INPUT_FR = """## Données d'entrée
+
+Descriptions des frames:
+{descriptions}
+
+{audio_section}
+"""
+
+
+CONCLUSION_INPUT_AR = """## البيانات المدخلة
+
+أوصاف الإطارات:
+{descriptions}
+
+{audio_section}
+"""
+
+
+# Neutralizes raw HTML and stray code-span markers in model output before it
+# is embedded in the markdown report (one C-level pass per description)
+_MD_ESCAPE = str.maketrans({'<': '&lt;', '>': '&gt;', '`': '\\`'})
+
+# Heading the conclusion prompts ask for when audio analysis is provided
+AUDIO_SECTION_HEADER = "### 🎧 Analyse Audio"
+
+# First section after the audio slot in the conclusion prompts, where a
+# missing audio section is inserted (single scan)
+_AUDIO_INSERT_RE = re.compile(r"^## (?:💡 Recommandations|الاستنتاجات والتوصيات|Conclusion)", re.MULTILINE)
+
+# Words that flag a report as describing an emergency
+EMERGENCY_WORDS = ("urgence", "emergency", "détresse", "blessé", "injured")
+
+
+def _caseless_bytes_pattern(word: str) -> bytes:
+    """UTF-8 byte pattern matching ``word`` in any letter case.
+    
+    re.IGNORECASE on bytes only folds ASCII, so accented letters get an
+    explicit lower/upper alternation.
+    """
+    return b"".join(
+        re.escape(c.encode('utf-8')) if c.lower() == c.upper()
+        else b"(?:" + re.escape(c.lower().encode('utf-8')) + b"|" + re.escape(c.upper().encode('utf-8')) + b")"
+        for c in word
+    )
+
+
+# Case-insensitive matchers run directly over the memory-mapped report
+_EMERGENCY_BYTES_RE = re.compile(b"|".join(_caseless_bytes_pattern(w) for w in EMERGENCY_WORDS))
+_AUDIO_BYTES_RE = re.compile(_caseless_bytes_pattern("audio"))
+
+# One line-anchored pass for the header fields (\n, \r\n or \r line ends);
+# branch order mirrors the precedence title > generation date > frame count
+# within a line
+_SUMMARY_LINE_RE = re.compile(
+    "(?:^|(?<=\r))(?:# (?P<title>[^\r\n]*)"
+    "|[^\r\n]*?(?:Généré le:|تاريخ الإنشاء:)(?P<generated_at>[^\r\n]*)"
+    "|[^\r\n]*?(?:Frames analysées:|الإطارات المحللة:)(?P<frames>[^\r\n]*))".encode('utf-8'),
+    re.MULTILINE
+)
+
+
+# Conclusion prompt and input template per language (French for anything else)
+_CONCLUSION_PROMPTS = {"arabe": SUMMARIZATION_PROMPT_AR}
+_CONCLUSION_INPUTS = {"arabe": CONCLUSION_INPUT_AR}
+
+# Input templates split once into (literal, field) pairs so rendering is a join
+_CONCLUSION_PROMPT_PARTS = {
+    prompt: [(literal, field) for literal, field, _, _ in string.Formatter().parse(prompt)]
+    for prompt in (CONCLUSION_INPUT_FR, CONCLUSION_INPUT_AR)
+}
+
+
 def get_conclusion_prompt(language: str = "français") -> str:
-    """Get the appropriate conclusion prompt based on language."""
-    if language == "arabe":
-        return SUMMARIZATION_PROMPT_AR
-    return CONCLUSION_PROMPT_FR
+    """Get the static conclusion instructions (system prompt) for a language."""
+    return _CONCLUSION_PROMPTS.get(language, CONCLUSION_PROMPT_FR)
+
+
+def get_conclusion_input(language: str = "français") -> str:
+    """Get the template of the per-report input message for a language."""
+    return _CONCLUSION_INPUTS.get(language, CONCLUSION_INPUT_FR)
+
+
+def _render_prompt(prompt: str, values: Dict[str, str]) -> str:
+    """Fill a conclusion input template from its pre-parsed parts (same output as str.format)."""
+    return "".join([
+        literal + values[field] if field else literal
+        for literal, field in _CONCLUSION_PROMPT_PARTS[prompt]
+    ])
 
 
 def generate_report(
@@ -149,8 +232,9 @@ def generate_report(
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
     
-    # Generate unique filename
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Generate unique filename; the same instant is shown in the reports
+    now = datetime.now()
+    timestamp = now.strftime("%Y%m%d_%H%M%S")
     md_file = output_path / f"report_{timestamp}.md"
     html_file = output_path / f"report_{timestamp}.html"
     
@@ -159,16 +243,81 @@ def generate_report(
         audio_results=audio_results,
         vision_client=vision_client,
         output_path=str(md_file),
+        language=language,
+        now=now
+    )
+
+
+async def generate_report_async(
+    frame_descriptions: List[Dict[str, Any]],
+    audio_results: Optional[Dict[str, Any]] = None,
+    vision_client: VisionClient = None,
+    output_dir: str = None,
+    language: str = "français"
+) -> Tuple[str, str]:
+    """Async variant of generate_report for event-loop callers (e.g. the API).
+    
+    The LLM call, report writes and HTML render run in a worker thread, so
+    the event loop keeps serving requests and several reports can be
+    generated concurrently.
+    
+    Returns:
+        Tuple of (markdown_path, html_path)
+    """
+    return await asyncio.to_thread(
+        generate_report,
+        frame_descriptions,
+        audio_results=audio_results,
+        vision_client=vision_client,
+        output_dir=output_dir,
         language=language
     )
 
 
+def _assemble_frame_sections(
+    descriptions: List[Dict[str, Any]]
+) -> Tuple[List[str], List[str]]:
+    """
+    Build the per-frame report sections and the conclusion prompt input.
+    
+    One pass over the descriptions; the sections are joined once by the
+    caller. This is the only per-frame loop of report generation, so it
+    avoids Path objects and attribute lookups inside the loop.
+    
+    Args:
+        descriptions: List of frame analysis results
+        
+    Returns:
+        Tuple of (frame_sections, successful_frame_descriptions)
+    """
+    frame_parts = []
+    success_desc_parts = []
+    add_frame = frame_parts.append
+    add_success = success_desc_parts.append
+    basename = os.path.basename
+    
+    # Ajouter chaque frame individuellement avec numérotation claire
+    for i, desc in enumerate(descriptions, 1):
+        if desc.get('status') == 'success':
+            # The name sits in a code span, where backslash escapes are literal
+            frame_name = basename(desc['frame_path']).replace('`', "'")
+            frame_desc = desc['description']
+            add_frame(f"### 📸 Frame {i} - `{frame_name}`\n\n{frame_desc.translate(_MD_ESCAPE)}\n\n---\n\n")
+            add_success(f"**Frame {i}**: {frame_desc}")
+        else:
+            error_desc = str(desc.get('description', 'Inconnue')).translate(_MD_ESCAPE)
+            add_frame(f"### ⚠️ Frame {i} - Erreur d'analyse\n\nErreur: {error_desc}\n\n---\n\n")
+    
+    return frame_parts, success_desc_parts
+
+
 def summarize_report(
     descriptions: List[Dict[str, Any]],
     audio_results: Optional[Dict[str, Any]] = None,
     vision_client: VisionClient = None,
     output_path: str = "output/report.md",
-    language: str = "français"
+    language: str = "français",
+    now: Optional[datetime] = None
 ) -> Tuple[str, Optional[str]]:
     """Generate final incident report from frame descriptions.
     
@@ -178,12 +327,16 @@ def summarize_report(
         vision_client: VisionClient instance
         output_path: Path to save markdown report
         language: Language for the report
+        now: Generation time shown in the reports (defaults to the current time)
         
     Returns:
         Tuple of (markdown_path, html_path)
     """
+    if now is None:
+        now = datetime.now()
+    
     if vision_client is None:
-        vision_client = VisionClient(provider="llava")
+        vision_client = get_vision_client("llava")
     
     logger.info(f"Generating frame-by-frame report with global conclusion in {language}")
     
@@ -191,121 +344,140 @@ def summarize_report(
     # PARTIE 1: ANALYSE FRAME PAR FRAME DÉTAILLÉE
     # ============================================
     
-    frame_by_frame_report = "# 🎥 Rapport d'Analyse Vidéo d'Incident\n\n"
-    frame_by_frame_report += f"**Date**: {datetime.now().strftime('%d/%m/%Y %H:%M')}\n"
-    frame_by_frame_report += f"**Frames analysées**: {len([d for d in descriptions if d.get('status') == 'success'])}\n\n"
-    frame_by_frame_report += "---\n\n"
-    frame_by_frame_report += "## 🔍 Analyse Frame par Frame (Llava)\n\n"
+    frame_parts, success_desc_parts = _assemble_frame_sections(descriptions)
     
-    # Ajouter chaque frame individuellement avec numérotation claire
-    for i, desc in enumerate(descriptions):
-        if desc.get('status') == 'success':
-            frame_num = i + 1
-            frame_name = Path(desc['frame_path']).name
-            frame_desc = desc['description']
-            
-            frame_by_frame_report += f"### 📸 Frame {frame_num} - `{frame_name}`\n\n"
-            frame_by_frame_report += f"{frame_desc}\n\n"
-            frame_by_frame_report += "---\n\n"
-        else:
-            frame_by_frame_report += f"### ⚠️ Frame {i+1} - Erreur d'analyse\n\n"
-            frame_by_frame_report += f"Erreur: {desc.get('description', 'Inconnue')}\n\n"
-            frame_by_frame_report += "---\n\n"
+    success_count = len(success_desc_parts)
+    
+    # Kept as parts: they are streamed to the markdown file and joined only
+    # once, into the full report
+    frame_by_frame_parts = [
+        "# 🎥 Rapport d'Analyse Vidéo d'Incident\n\n",
+        f"**Date**: {now.strftime('%d/%m/%Y %H:%M')}\n",
+        f"**Frames analysées**: {success_count}\n\n",
+        "---\n\n",
+        "## 🔍 Analyse Frame par Frame (Llava)\n\n",
+        *frame_parts
+    ]
     
     # ============================================
     # PARTIE 2: CONCLUSION GÉNÉRALE SYNTHÉTIQUE
     # ============================================
     
     # Format frame descriptions for conclusion generation
-    desc_text = "\n\n".join([
-        f"**Frame {i+1}**: {d['description']}"
-        for i, d in enumerate(descriptions)
-        if d.get('status') == 'success'
-    ])
+    desc_text = "\n\n".join(success_desc_parts)
     
     # Format audio section if available
     audio_section = ""
     audio_report_section = ""
     
     if audio_results and audio_results.get("has_audio"):
-        from .audio_analyzer import format_audio_summary
         audio_summary = format_audio_summary(audio_results)
         
         if language == "arabe":
             audio_section = f"\n**تحليل الصوت**:\n{audio_summary}"
-            audio_report_section = "### 🎧 Analyse Audio\nRésultats de l'analyse audio extraite de la vidéo."
+            audio_report_section = f"{AUDIO_SECTION_HEADER}\nRésultats de l'analyse audio extraite de la vidéo."
         else:
             audio_section = f"\n**Analyse Audio**:\n{audio_summary}"
-            audio_report_section = "### 🎧 Analyse Audio\nRésultats de l'analyse audio extraite de la vidéo."
-    
-    # Get the appropriate prompt for conclusion
-    prompt_template = get_conclusion_prompt(language)
-    prompt = prompt_template.format(
-        descriptions=desc_text,
-        audio_section=audio_section,
-        audio_report_section=audio_report_section
-    )
+            audio_report_section = f"{AUDIO_SECTION_HEADER}\nRésultats de l'analyse audio extraite de la vidéo."
     
-    conclusion_report = ""
+    # Static instructions go first (system prompt, cacheable by the backend),
+    # the report data last
+    system_prompt = get_conclusion_prompt(language)
+    prompt = _render_prompt(get_conclusion_input(language), {
+        "descriptions": desc_text,
+        "audio_section": audio_section
+    })
     
-    try:
-        # Generate conclusion using LLM
-        logger.info("Generating global conclusion with Llava...")
-        conclusion_content = vision_client.generate_text(prompt)
-        
-        conclusion_report = "\n\n" + "="*80 + "\n\n"
-        conclusion_report += "# 📊 CONCLUSION GÉNÉRALE\n\n"
-        conclusion_report += conclusion_content
-        
-        # Inject detailed audio section if available
-        if audio_section and audio_report_section not in conclusion_content:
-            conclusion_report += f"\n\n{audio_report_section}\n{audio_section}"
-        
-    except Exception as e:
-        logger.error(f"Failed to generate conclusion with LLM: {e}")
-        
-        # Fallback: create basic conclusion
-        conclusion_report = "\n\n" + "="*80 + "\n\n"
-        conclusion_report += "# 📊 CONCLUSION GÉNÉRALE\n\n"
-        conclusion_report += "## ⚠️ Synthèse\n\n"
-        conclusion_report += f"Analyse de {len([d for d in descriptions if d.get('status') == 'success'])} frames effectuée.\n\n"
-        if audio_section:
-            conclusion_report += f"{audio_report_section}\n{audio_section}\n\n"
-    
-    # Combine both parts
-    full_report = frame_by_frame_report + conclusion_report
-    
-    # Save markdown report
+    # Stream the markdown report to disk while the conclusion is generated:
+    # the frame-by-frame part is written before the LLM call and answer
+    # chunks are appended as they arrive
     output_file = Path(output_path)
     output_file.parent.mkdir(parents=True, exist_ok=True)
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(full_report)
+    conclusion_header = "".join(["\n\n", "="*80, "\n\n", "# 📊 CONCLUSION GÉNÉRALE\n\n"])
     
-    logger.info(f"Markdown report saved to: {output_path}")
+    with open_report_file(output_file) as md:
+        md.writelines(frame_by_frame_parts)
+        md.write(conclusion_header)
+        conclusion_start = md.tell()
+        
+        try:
+            # Generate conclusion using LLM
+            logger.info("Generating global conclusion with Llava...")
+            conclusion_chunks = []
+            for chunk in vision_client.generate_text_stream(prompt, system_prompt):
+                md.write(chunk)
+                conclusion_chunks.append(chunk)
+            conclusion_content = "".join(conclusion_chunks)
+            
+            # Inject detailed audio section if available: before the
+            # recommendations when the model wrote them, else at the end
+            conclusion_tail = []
+            if audio_section and AUDIO_SECTION_HEADER not in conclusion_content:
+                match = _AUDIO_INSERT_RE.search(conclusion_content)
+                if match:
+                    conclusion_content = "".join([
+                        conclusion_content[:match.start()],
+                        f"{audio_report_section}\n{audio_section}\n\n",
+                        conclusion_content[match.start():]
+                    ])
+                    md.seek(conclusion_start)
+                    md.truncate()
+                    md.write(conclusion_content)
+                else:
+                    conclusion_tail.append(f"\n\n{audio_report_section}\n{audio_section}")
+            
+        except Exception as e:
+            logger.error(f"Failed to generate conclusion with LLM: {e}")
+            
+            # Drop any partially streamed answer
+            md.seek(conclusion_start)
+            md.truncate()
+            conclusion_content = ""
+            
+            # Fallback: create basic conclusion
+            conclusion_tail = [
+                "## ⚠️ Synthèse\n\n",
+                f"Analyse de {success_count} frames effectuée.\n\n",
+            ]
+            if audio_section:
+                conclusion_tail.append(f"{audio_report_section}\n{audio_section}\n\n")
+        
+        md.writelines(conclusion_tail)
+    
+    # Combine both parts
+    full_report = "".join([*frame_by_frame_parts, conclusion_header, conclusion_content, *conclusion_tail])
     
     # Generate HTML report
+    html_file = None
     html_path = str(output_file).replace('.md', '.html')
     try:
         html_file = markdown_to_html(
             full_report,
             frames_count=len(descriptions),
             language=language,
-            output_path=html_path
+            output_path=html_path,
+            now=now
         )
-        
-        if html_file:
-            logger.info(f"HTML report saved to: {html_file}")
-            return str(output_file), html_file
     except Exception as e:
         logger.error(f"Failed to generate HTML report: {e}")
     
+    logger.info(f"Markdown report saved to: {output_path}")
+    
+    if html_file:
+        logger.info(f"HTML report saved to: {html_file}")
+        return str(output_file), html_file
+    
     return str(output_file), None
 
 
 def get_report_summary(report_path: str) -> Dict[str, Any]:
     """Extract summary information from a generated report.
     
+    The report is memory-mapped and scanned by compiled byte regexes (one
+    pass for the header fields, one search per flag), so large reports are
+    never copied into Python strings.
+    
     Args:
         report_path: Path to markdown report
         
@@ -313,34 +485,34 @@ def get_report_summary(report_path: str) -> Dict[str, Any]:
         Dictionary with summary info
     """
     try:
-        with open(report_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Extract key info
-        lines = content.split('\n')
-        
         summary = {
             "path": report_path,
             "title": "",
             "generated_at": "",
             "frames_count": 0,
-            "has_audio": "audio" in content.lower(),
-            "emergency_detected": any(
-                word in content.lower() 
-                for word in ["urgence", "emergency", "détresse", "blessé", "injured"]
-            )
+            "has_audio": False,
+            "emergency_detected": False
         }
         
-        for line in lines:
-            if line.startswith("# "):
-                summary["title"] = line[2:].strip()
-            elif "Généré le:" in line or "تاريخ الإنشاء:" in line:
-                summary["generated_at"] = line.split(":")[-1].strip().rstrip("*")
-            elif "Frames analysées:" in line or "الإطارات المحللة:" in line:
-                try:
-                    summary["frames_count"] = int(line.split(":")[-1].strip().rstrip("*"))
-                except:
-                    pass
+        with open(report_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return summary
+            
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                summary["has_audio"] = _AUDIO_BYTES_RE.search(mm) is not None
+                summary["emergency_detected"] = _EMERGENCY_BYTES_RE.search(mm) is not None
+                
+                for match in _SUMMARY_LINE_RE.finditer(mm):
+                    title, generated_at, frames = match.group("title", "generated_at", "frames")
+                    if title is not None:
+                        summary["title"] = title.decode('utf-8', 'replace').strip()
+                    elif generated_at is not None:
+                        summary["generated_at"] = generated_at.rsplit(b":", 1)[-1].decode('utf-8', 'replace').strip().rstrip("*")
+                    else:
+                        try:
+                            summary["frames_count"] = int(frames.rsplit(b":", 1)[-1].decode('utf-8', 'replace').strip().rstrip("*"))
+                        except ValueError:
+                            pass
         
         return summary
         
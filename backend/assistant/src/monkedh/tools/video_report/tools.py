@@ -4,11 +4,12 @@ from typing import Type, List, Dict, Any
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
 
-from .frame_extractor import extract_frames, get_video_info
+from .frame_extractor import extract_frames, extracted_frame_hashes, get_video_info
 from .vision_analyzer import analyze_frame, analyze_frames_batch
 from .report_generator import summarize_report, generate_report
 from .audio_analyzer import analyze_video_audio, format_audio_summary
-from .vision_client import VisionClient
+from .vision_client import get_vision_client
+from .pipeline_state import PipelineState
 
 
 # Input schemas
@@ -61,7 +62,9 @@ class FrameExtractionTool(BaseTool):
             List of paths to extracted frame images
         """
         print(f"\n🎬 Extracting frames: {video_path} (every {every_n_seconds}s)")
-        frame_paths = extract_frames(video_path, every_n_seconds)
+        # Near-duplicates are clustered once, by analyze_frames_batch
+        frames = extract_frames(video_path, every_n_seconds)
+        frame_paths = [path for path, _, _ in frames]
         print(f"✅ Extracted {len(frame_paths)} frames\n")
         return frame_paths
 
@@ -84,12 +87,13 @@ class VisionAnalysisTool(BaseTool):
             List of frame descriptions
         """
         print(f"\n🔍 Analyzing {len(frame_paths)} frames with Vision AI...\n")
-        client = VisionClient(provider="llava")
+        client = get_vision_client("llava")
         
         descriptions = analyze_frames_batch(
             frame_paths,
             vision_client=client,
-            language=language
+            language=language,
+            frame_hashes=extracted_frame_hashes(frame_paths)
         )
         
         print(f"\n✅ Vision analysis complete\n")
@@ -122,7 +126,7 @@ class ReportGenerationTool(BaseTool):
         lang_display = "arabe" if language == "arabe" else "français"
         print(f"\n📝 Génération du rapport en {lang_display}...\n")
         
-        client = VisionClient(provider="llava")
+        client = get_vision_client("llava")
         md_path, html_path = summarize_report(
             descriptions, 
             audio_results=audio_results,
@@ -156,7 +160,13 @@ class AudioAnalysisTool(BaseTool):
         """
         print(f"\n🎧 Analyzing audio from video: {video_path}\n")
         
-        results = analyze_video_audio(video_path, language=language)
+        state = PipelineState.for_video(video_path)
+        if state.has_audio_result(language):
+            print("♻️ Reusing audio analysis from a previous run\n")
+            results = state.audio_results[language]
+        else:
+            results = analyze_video_audio(video_path, language=language)
+            state.set_audio_result(language, results)
         
         if not results:
             print("⚠️ No audio found or analysis failed\n")
@@ -1,11 +1,124 @@
 """Vision analysis module for frame-by-frame video analysis."""
+import os
+import json
+import hashlib
+import time
+import random
 import logging
-from typing import Dict, Any
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional
 
-from .vision_client import VisionClient
+from .frame_extractor import iter_frames, hash_frame_file, cluster_similar_frames
+from .vision_client import VisionClient, get_vision_client, ImageSource, MULTI_IMAGE_PROVIDERS
 
 logger = logging.getLogger(__name__)
 
+# Frames analyzed in flight at once; match the vision deployment's concurrency limit
+VISION_MAX_CONCURRENCY = int(os.getenv("VISION_MAX_CONCURRENCY", "4"))
+
+# On-disk cache of frame descriptions keyed by image content + prompt
+VISION_CACHE_DIR = Path(os.getenv("VISION_CACHE_DIR", "output/.vision_cache"))
+
+# Descriptions kept in memory so hot keys skip the disk within a run
+VISION_CACHE_MEMORY_SIZE = 1024
+
+# Attempts per frame before it is reported as failed; transient failures
+# (timeouts, dropped connections, 429 and 5xx) back off exponentially with jitter
+VISION_MAX_ATTEMPTS = int(os.getenv("VISION_MAX_ATTEMPTS", "3"))
+VISION_BACKOFF_BASE = 0.5
+VISION_BACKOFF_MAX = 8.0
+
+# httpx / openai transport errors, matched by class name so neither SDK has
+# to be importable here
+_TRANSIENT_ERROR_NAMES = frozenset({
+    "TimeoutException", "ConnectTimeout", "ReadTimeout", "WriteTimeout", "PoolTimeout",
+    "ConnectError", "ReadError", "WriteError", "RemoteProtocolError",
+    "APITimeoutError", "APIConnectionError",
+})
+
+# Maximum dHash Hamming distance (of 64 bits) between frames treated as the
+# same scene by analyze_frames_batch; negative disables deduplication
+VISION_DEDUP_THRESHOLD = int(os.getenv("VISION_DEDUP_THRESHOLD", "6"))
+
+# Frames sent per vision request. llava-1.5 is trained on single images, so
+# batching is opt-in for backends that handle several images per message
+VISION_FRAMES_PER_REQUEST = int(os.getenv("VISION_FRAMES_PER_REQUEST", "1"))
+
+
+class FrameAnalysisCache:
+    """Disk cache of vision descriptions keyed by a blake2b hash of the frame bytes.
+    
+    Identical frames (re-runs on the same video, repeated analyses) skip the
+    vision model entirely. The prompt and provider are part of the key so a
+    prompt change never serves stale descriptions.
+    """
+    
+    def __init__(self, cache_dir: Path = VISION_CACHE_DIR, memory_size: int = VISION_CACHE_MEMORY_SIZE):
+        self.cache_dir = Path(cache_dir)
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key(image: ImageSource, prompt: str, provider: str) -> str:
+        """Fingerprint a frame (file path or encoded bytes) for the given prompt and provider."""
+        digest = hashlib.blake2b(digest_size=16)
+        if isinstance(image, bytes):
+            digest.update(image)
+        else:
+            with open(image, "rb") as f:
+                digest.update(f.read())
+        digest.update(provider.encode("utf-8"))
+        digest.update(prompt.encode("utf-8"))
+        return digest.hexdigest()
+    
+    def _remember(self, key: str, description: str) -> None:
+        """Insert into the in-memory LRU, evicting the oldest entries."""
+        with self._lock:
+            self._memory[key] = description
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached description, or None on miss."""
+        with self._lock:
+            description = self._memory.get(key)
+            if description is not None:
+                self._memory.move_to_end(key)
+                return description
+        try:
+            with open(self.cache_dir / f"{key}.json", "r", encoding="utf-8") as f:
+                description = json.load(f)["description"]
+        except (OSError, ValueError, KeyError):
+            return None
+        self._remember(key, description)
+        return description
+    
+    def set(self, key: str, description: str) -> None:
+        """Store a description; cache failures are never fatal.
+        
+        The file is written under a temporary name and renamed into place so
+        concurrent readers never load a partial entry.
+        """
+        self._remember(key, description)
+        cache_file = self.cache_dir / f"{key}.json"
+        tmp_file = cache_file.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump({"description": description}, f, ensure_ascii=False)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logger.warning(f"Could not cache frame analysis: {e}")
+
+
+_frame_cache = FrameAnalysisCache()
+
 
 VISION_PROMPT = """Analyze this image from a surveillance or incident video for emergency response purposes.
 
@@ -58,25 +171,119 @@ Cette analyse sera utilisée par les intervenants d'urgence médicale pour éval
 """
 
 
+MULTI_FRAME_INSTRUCTIONS = """
+You receive {count} frames from the same video, in chronological order.
+Describe each frame separately following the instructions above.
+Return ONLY a JSON array of {count} objects with the fields "frame_index" (1 to {count}) and "description".
+"""
+
+MULTI_FRAME_INSTRUCTIONS_FR = """
+Tu reçois {count} images de la même vidéo, dans l'ordre chronologique.
+Décris chaque image séparément en suivant les instructions ci-dessus.
+Réponds UNIQUEMENT avec un tableau JSON de {count} objets avec les champs "frame_index" (1 à {count}) et "description".
+"""
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a vision request failure is worth retrying."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in _TRANSIENT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def _call_with_retry(call: Callable[[], str], label: str) -> str:
+    """
+    Run a vision request, retrying transient failures with backoff.
+    
+    Args:
+        call: Zero-argument function performing the request
+        label: What is being analyzed, for the retry log
+        
+    Returns:
+        Result of call()
+    """
+    for attempt in range(1, VISION_MAX_ATTEMPTS + 1):
+        try:
+            return call()
+        except Exception as e:
+            if attempt == VISION_MAX_ATTEMPTS or not _is_transient(e):
+                raise
+            delay = min(VISION_BACKOFF_MAX, VISION_BACKOFF_BASE * 2 ** (attempt - 1))
+            delay += random.uniform(0, VISION_BACKOFF_BASE)
+            logger.warning(
+                f"⚠️ Vision request failed for {label} ({type(e).__name__}), "
+                f"retrying in {delay:.1f}s (attempt {attempt}/{VISION_MAX_ATTEMPTS})"
+            )
+            time.sleep(delay)
+
+
+@lru_cache(maxsize=32)
+def _multi_frame_prompt(language: str, count: int) -> str:
+    """Build (once per language and group size) the prompt of a multi-frame request."""
+    if language == "français":
+        return VISION_PROMPT_FR + MULTI_FRAME_INSTRUCTIONS_FR.format(count=count)
+    return VISION_PROMPT + MULTI_FRAME_INSTRUCTIONS.format(count=count)
+
+
+def _parse_multi_frame_response(response: str, count: int) -> Optional[List[str]]:
+    """Extract per-frame descriptions from a multi-frame JSON answer.
+    
+    Returns:
+        Descriptions in frame order, or None if the answer does not cover
+        every frame exactly once
+    """
+    start, end = response.find("["), response.rfind("]")
+    if start < 0 or end <= start:
+        return None
+    try:
+        items = json.loads(response[start:end + 1])
+    except ValueError:
+        return None
+    
+    descriptions = [None] * count
+    for item in items if isinstance(items, list) else ():
+        try:
+            index = int(item["frame_index"]) - 1
+            description = str(item["description"]).strip()
+        except (TypeError, KeyError, ValueError):
+            return None
+        if not 0 <= index < count or descriptions[index] is not None or not description:
+            return None
+        descriptions[index] = description
+    
+    return None if None in descriptions else descriptions
+
+
 def analyze_frame(
     image_path: str,
     vision_client: VisionClient = None,
     prompt: str = None,
-    language: str = "français"
+    language: str = "français",
+    image_bytes: bytes = None,
+    use_cache: bool = True
 ) -> Dict[str, Any]:
     """Analyze a single frame using vision model.
     
     Args:
-        image_path: Path to frame image
+        image_path: Path to frame image (only a label when image_bytes is given)
         vision_client: VisionClient instance (creates new if None)
         prompt: Analysis prompt (uses default if None)
         language: Language for prompt ("français" or "english")
+        image_bytes: Encoded frame to analyze instead of reading image_path
+        use_cache: Reuse and store descriptions in the frame analysis cache
         
     Returns:
         Dict containing frame_path, description, and status
     """
+    image = image_bytes if image_bytes is not None else image_path
     if vision_client is None:
-        vision_client = VisionClient(provider="llava")
+        vision_client = get_vision_client("llava")
     
     if prompt is None:
         prompt = VISION_PROMPT_FR if language == "français" else VISION_PROMPT
@@ -84,7 +291,16 @@ def analyze_frame(
     logger.info(f"Analyzing frame: {image_path}")
     
     try:
-        description = vision_client.analyze_image(image_path, prompt)
+        description = None
+        if use_cache:
+            cache_key = FrameAnalysisCache.key(image, prompt, vision_client.provider)
+            description = _frame_cache.get(cache_key)
+        if description is not None:
+            logger.info(f"Vision cache hit for: {image_path}")
+        else:
+            description = _call_with_retry(lambda: vision_client.analyze_image(image, prompt), image_path)
+            if use_cache:
+                _frame_cache.set(cache_key, description)
         
         result = {
             "frame_path": image_path,
@@ -104,38 +320,240 @@ def analyze_frame(
         }
 
 
+def analyze_frames_multi(
+    frame_paths: list,
+    vision_client: VisionClient = None,
+    language: str = "français",
+    use_cache: bool = True
+) -> list:
+    """Analyze several frames with a single multi-image vision request.
+    
+    Cached frames are served from the frame analysis cache and only the
+    misses are sent. If the provider has no multi-image support, the request
+    fails or the answer cannot be matched to every frame, the frames are
+    analyzed one by one instead.
+    
+    Args:
+        frame_paths: List of paths to frame images
+        vision_client: VisionClient instance
+        language: Language for analysis
+        use_cache: Reuse and store descriptions in the frame analysis cache
+        
+    Returns:
+        List of analysis results in input order
+    """
+    if vision_client is None:
+        vision_client = get_vision_client("llava")
+    
+    prompt = VISION_PROMPT_FR if language == "français" else VISION_PROMPT
+    results = [None] * len(frame_paths)
+    pending = []
+    
+    for i, frame_path in enumerate(frame_paths):
+        description = None
+        if use_cache:
+            cache_key = FrameAnalysisCache.key(frame_path, prompt, vision_client.provider)
+            description = _frame_cache.get(cache_key)
+        if description is not None:
+            logger.info(f"Vision cache hit for: {frame_path}")
+            results[i] = {"frame_path": frame_path, "description": description, "status": "success"}
+        else:
+            pending.append(i)
+    
+    descriptions = None
+    if len(pending) > 1 and vision_client.provider in MULTI_IMAGE_PROVIDERS:
+        logger.info(f"Analyzing {len(pending)} frames in one request")
+        try:
+            response = vision_client.analyze_images(
+                [frame_paths[i] for i in pending],
+                _multi_frame_prompt(language, len(pending))
+            )
+            descriptions = _parse_multi_frame_response(response, len(pending))
+            if descriptions is None:
+                logger.warning("⚠️ Multi-frame answer did not match the frames, analyzing them one by one")
+        except Exception as e:
+            logger.warning(f"⚠️ Multi-frame request failed ({e}), analyzing frames one by one")
+    
+    if descriptions is None:
+        for i in pending:
+            results[i] = analyze_frame(frame_paths[i], vision_client, prompt, language, use_cache=use_cache)
+        return results
+    
+    for i, description in zip(pending, descriptions):
+        if use_cache:
+            _frame_cache.set(FrameAnalysisCache.key(frame_paths[i], prompt, vision_client.provider), description)
+        results[i] = {"frame_path": frame_paths[i], "description": description, "status": "success"}
+    return results
+
+
 def analyze_frames_batch(
     frame_paths: list,
     vision_client: VisionClient = None,
     language: str = "français",
-    progress_callback: callable = None
+    progress_callback: callable = None,
+    max_workers: int = None,
+    use_cache: bool = True,
+    frames_per_request: int = None,
+    dedup_threshold: int = None,
+    frame_hashes: list = None
 ) -> list:
-    """Analyze multiple frames.
+    """Analyze multiple frames with concurrent vision requests.
+    
+    Near-duplicate frames (anywhere in the video) are grouped by dHash and
+    only one representative per group is sent to the vision model; the
+    other frames reuse its description and carry a "dedup_source" key.
+    
+    Requests are fanned out over a bounded thread pool so the vision
+    backend can batch them server-side; results keep the input order.
+    With more than one frame per request, consecutive frames are grouped
+    into multi-image requests (see analyze_frames_multi).
     
     Args:
         frame_paths: List of paths to frame images
         vision_client: VisionClient instance
         language: Language for analysis
         progress_callback: Optional callback(current, total) for progress updates
+        max_workers: Concurrent requests (defaults to VISION_MAX_CONCURRENCY)
+        use_cache: Reuse and store descriptions in the frame analysis cache
+        frames_per_request: Frames per vision request (defaults to VISION_FRAMES_PER_REQUEST)
+        dedup_threshold: Maximum dHash distance of duplicates (defaults to
+            VISION_DEDUP_THRESHOLD; negative disables deduplication)
+        frame_hashes: dHash per frame when already known (e.g. from extract_frames)
         
     Returns:
         List of analysis results
     """
     if vision_client is None:
-        vision_client = VisionClient(provider="llava")
+        vision_client = get_vision_client("llava")
     
-    results = []
     total = len(frame_paths)
-    
-    for i, frame_path in enumerate(frame_paths):
-        result = analyze_frame(
-            frame_path,
-            vision_client,
-            language=language
+    if dedup_threshold is None:
+        dedup_threshold = VISION_DEDUP_THRESHOLD
+    if dedup_threshold < 0 or total < 2:
+        return _analyze_frames(
+            frame_paths, vision_client, language, progress_callback,
+            max_workers, use_cache, frames_per_request
         )
+    
+    if frame_hashes is None:
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as pool:
+            frame_hashes = list(pool.map(hash_frame_file, frame_paths))
+    representatives = cluster_similar_frames(frame_hashes, dedup_threshold)
+    unique = sorted(set(representatives))
+    progress = progress_callback
+    if len(unique) < total:
+        logger.info(f"Analyzing {len(unique)} distinct frames out of {total} (near-duplicates share descriptions)")
+        if progress_callback:
+            # Report against every frame passed in, reused duplicates counting as done
+            reused = total - len(unique)
+            def progress(done, _):
+                progress_callback(done + reused, total)
+    
+    unique_results = dict(zip(unique, _analyze_frames(
+        [frame_paths[i] for i in unique], vision_client, language, progress,
+        max_workers, use_cache, frames_per_request
+    )))
+    
+    results = []
+    for i, rep in enumerate(representatives):
+        result = unique_results[rep]
+        if rep != i:
+            result = {**result, "frame_path": frame_paths[i], "dedup_source": frame_paths[rep]}
         results.append(result)
+    return results
+
+
+def _analyze_frames(
+    frame_paths: list,
+    vision_client: VisionClient,
+    language: str,
+    progress_callback: Optional[callable],
+    max_workers: Optional[int],
+    use_cache: bool,
+    frames_per_request: Optional[int]
+) -> list:
+    """Send every frame to the vision model over the thread pool (see analyze_frames_batch)."""
+    total = len(frame_paths)
+    results = [None] * total
+    if not total:
+        return results
+    
+    group_size = max(1, frames_per_request or VISION_FRAMES_PER_REQUEST)
+    if group_size == 1:
+        def analyze_group(start):
+            return [analyze_frame(frame_paths[start], vision_client, language=language, use_cache=use_cache)]
+    else:
+        def analyze_group(start):
+            return analyze_frames_multi(
+                frame_paths[start:start + group_size], vision_client, language, use_cache=use_cache
+            )
+    
+    starts = range(0, total, group_size)
+    workers = min(max_workers or VISION_MAX_CONCURRENCY, len(starts))
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(analyze_group, start): start for start in starts}
+        for future in as_completed(futures):
+            group_results = future.result()
+            start = futures[future]
+            results[start:start + len(group_results)] = group_results
+            done += len(group_results)
+            
+            if progress_callback:
+                progress_callback(done, total)
+    
+    return results
+
+
+def analyze_video_stream(
+    video_path: str,
+    every_n_seconds: float = 2.0,
+    vision_client: VisionClient = None,
+    language: str = "français",
+    save_dir: str = None,
+    max_workers: int = None,
+    use_cache: bool = True
+) -> list:
+    """Extract and analyze frames in one streaming pass.
+    
+    Frames go from the decoder to the vision model as in-memory JPEGs, so
+    nothing is written to and read back from disk, and analysis of early
+    frames overlaps with decoding of later ones.
+    
+    Args:
+        video_path: Path to video file
+        every_n_seconds: Analyze one frame every N seconds
+        vision_client: VisionClient instance
+        language: Language for analysis
+        save_dir: Optionally also write the frames here (for debugging)
+        max_workers: Concurrent requests (defaults to VISION_MAX_CONCURRENCY)
+        use_cache: Reuse and store descriptions in the frame analysis cache
         
-        if progress_callback:
-            progress_callback(i + 1, total)
+    Returns:
+        List of analysis results in frame order, each with a timestamp
+    """
+    if vision_client is None:
+        vision_client = get_vision_client("llava")
     
+    workers = max_workers or VISION_MAX_CONCURRENCY
+    # Decoding pauses while every worker is busy, so JPEGs waiting for the
+    # vision model never pile up in memory
+    in_flight = threading.BoundedSemaphore(workers)
+    futures = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for frame_name, timestamp, jpeg_bytes in iter_frames(video_path, every_n_seconds, save_dir):
+            frame_path = str(Path(save_dir) / frame_name) if save_dir else frame_name
+            in_flight.acquire()
+            future = pool.submit(
+                analyze_frame, frame_path, vision_client, language=language, image_bytes=jpeg_bytes,
+                use_cache=use_cache
+            )
+            future.add_done_callback(lambda _: in_flight.release())
+            futures.append((timestamp, future))
+    
+    results = []
+    for timestamp, future in futures:
+        result = future.result()
+        result["timestamp"] = timestamp
+        results.append(result)
     return results
@@ -2,13 +2,21 @@
 Client multi-providers avec support OpenAI, Anthropic, Google, Llava pour vision.
 """
 import os
+import json
 import base64
 import logging
-from typing import Optional, Literal
-from pathlib import Path
+import threading
+from functools import lru_cache
+from typing import Iterator, List, Optional, Literal, Union
 
 from dotenv import load_dotenv
 
+try:
+    import pybase64
+    PYBASE64_AVAILABLE = True
+except ImportError:
+    PYBASE64_AVAILABLE = False
+
 # Load environment variables
 load_dotenv()
 
@@ -16,6 +24,74 @@ logger = logging.getLogger(__name__)
 
 ProviderType = Literal["openai", "anthropic", "google", "llava", "azure"]
 
+# An image file path, or encoded image bytes (e.g. a JPEG straight from cv2.imencode)
+ImageSource = Union[str, bytes]
+
+# Pooled connections per client to the Llava endpoint (sized above the
+# default vision concurrency so parallel frame requests never queue)
+HTTP_MAX_KEEPALIVE = 10
+HTTP_MAX_CONNECTIONS = 20
+
+# Providers whose chat API accepts several images in one message
+MULTI_IMAGE_PROVIDERS = ("llava", "openai", "azure")
+
+# MIME types by lowercase file extension (JPEG when unknown)
+IMAGE_MIME_TYPES = {
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+
+
+def _b64encode_bytes(data: Union[bytes, memoryview]) -> bytes:
+    """Base64 of raw bytes, using pybase64's SIMD codec when installed."""
+    if PYBASE64_AVAILABLE:
+        return pybase64.b64encode(data)
+    return base64.standard_b64encode(data)
+
+
+def _b64encode(data: Union[bytes, memoryview]) -> str:
+    """Base64 text of raw bytes."""
+    return _b64encode_bytes(data).decode("ascii")
+
+
+# Encoded "data:<mime>;base64," prefixes for the known image types
+_DATA_URI_PREFIXES = {
+    mime_type: f"data:{mime_type};base64,".encode("ascii")
+    for mime_type in set(IMAGE_MIME_TYPES.values())
+}
+
+
+def _data_uri(data: Union[bytes, memoryview], mime_type: str) -> str:
+    """Inline data: URI, joined as bytes and decoded to text once."""
+    prefix = _DATA_URI_PREFIXES.get(mime_type) or f"data:{mime_type};base64,".encode("ascii")
+    return (prefix + _b64encode_bytes(data)).decode("ascii")
+
+
+def _read_image_file(image_path: str, size: int) -> memoryview:
+    """Read a file straight into a buffer of its known size (no growing reads)."""
+    buffer = bytearray(size)
+    with open(image_path, "rb", buffering=0) as f:
+        read = f.readinto(buffer)
+    return memoryview(buffer)[:read]
+
+
+# Frames are re-encoded on retries, multi-frame fallbacks and repeated
+# analyses; recent payloads are kept (64 x ~200 KB at 1024px). Chat-style
+# providers cache whole data URIs, the others bare base64.
+@lru_cache(maxsize=64)
+def _encode_image_file(image_path: str, mtime_ns: int, size: int) -> str:
+    """Base64 of an image file; mtime and size in the key invalidate rewritten files."""
+    return _b64encode(_read_image_file(image_path, size))
+
+
+@lru_cache(maxsize=64)
+def _image_data_uri_file(image_path: str, mime_type: str, mtime_ns: int, size: int) -> str:
+    """data: URI of an image file, invalidated like _encode_image_file."""
+    return _data_uri(_read_image_file(image_path, size), mime_type)
+
 
 class VisionClient:
     """Client universel pour analyse d'images avec différents providers."""
@@ -56,29 +132,86 @@ class VisionClient:
         
         if not self.api_key:
             logger.warning(f"No API key found for provider: {provider}")
+        
+        # Llava HTTP clients, created on first use and reused so requests
+        # share pooled keep-alive connections (httpx clients are thread-safe)
+        self._http = None
+        self._llava_openai = None
+        self._client_lock = threading.Lock()
     
-    def _encode_image(self, image_path: str) -> str:
-        """Encode image to base64."""
-        with open(image_path, "rb") as f:
-            return base64.standard_b64encode(f.read()).decode("utf-8")
+    def _get_http(self):
+        """Shared httpx client for the Llava endpoints (TLS verification disabled)."""
+        if self._http is None:
+            import httpx
+            with self._client_lock:
+                if self._http is None:
+                    self._http = httpx.Client(
+                        verify=False,
+                        timeout=60.0,
+                        limits=httpx.Limits(
+                            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                            max_connections=HTTP_MAX_CONNECTIONS
+                        )
+                    )
+        return self._http
     
-    def _get_mime_type(self, image_path: str) -> str:
-        """Get MIME type from file extension."""
-        ext = Path(image_path).suffix.lower()
-        mime_types = {
-            ".jpg": "image/jpeg",
-            ".jpeg": "image/jpeg",
-            ".png": "image/png",
-            ".gif": "image/gif",
-            ".webp": "image/webp",
-        }
-        return mime_types.get(ext, "image/jpeg")
+    def _get_llava_openai(self):
+        """Shared OpenAI SDK client for Llava, on top of the pooled httpx client."""
+        if self._llava_openai is None:
+            from openai import OpenAI
+            http_client = self._get_http()
+            with self._client_lock:
+                if self._llava_openai is None:
+                    # Image clients never retry: vision_analyzer retries
+                    # transient failures with its own backoff
+                    self._llava_openai = OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        http_client=http_client,
+                        max_retries=0
+                    )
+        return self._llava_openai
+    
+    def close(self) -> None:
+        """Close the pooled HTTP connections."""
+        with self._client_lock:
+            if self._http is not None:
+                self._http.close()
+            self._http = None
+            self._llava_openai = None
+    
+    def __enter__(self) -> "VisionClient":
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
     
-    def analyze_image(self, image_path: str, prompt: str) -> str:
+    def _encode_image(self, image_path: ImageSource) -> str:
+        """Encode image to base64 (files are cached until they change on disk)."""
+        if isinstance(image_path, bytes):
+            return _b64encode(image_path)
+        stat = os.stat(image_path)
+        return _encode_image_file(str(image_path), stat.st_mtime_ns, stat.st_size)
+    
+    def _image_data_uri(self, image_path: ImageSource) -> str:
+        """Encode image to a data: URI (files are cached until they change on disk)."""
+        mime_type = self._get_mime_type(image_path)
+        if isinstance(image_path, bytes):
+            return _data_uri(image_path, mime_type)
+        stat = os.stat(image_path)
+        return _image_data_uri_file(str(image_path), mime_type, stat.st_mtime_ns, stat.st_size)
+    
+    def _get_mime_type(self, image_path: ImageSource) -> str:
+        """Get MIME type from file extension (or PNG signature for raw bytes)."""
+        if isinstance(image_path, bytes):
+            return "image/png" if image_path.startswith(b"\x89PNG") else "image/jpeg"
+        return IMAGE_MIME_TYPES.get(str(image_path).rpartition(".")[2].lower(), "image/jpeg")
+    
+    def analyze_image(self, image_path: ImageSource, prompt: str) -> str:
         """Analyze image using configured provider.
         
         Args:
-            image_path: Path to image file
+            image_path: Path to image file, or encoded image bytes
             prompt: Analysis prompt
             
         Returns:
@@ -97,59 +230,91 @@ class VisionClient:
         else:
             raise ValueError(f"Unsupported provider: {self.provider}")
     
-    def _analyze_with_llava(self, image_path: str, prompt: str) -> str:
-        """Analyze using Llava via ESPRIT TokenFactory."""
-        import httpx
+    def _image_part(self, image_path: ImageSource) -> dict:
+        """Build an OpenAI-style image_url content part for one image."""
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": self._image_data_uri(image_path)
+            }
+        }
+    
+    def analyze_images(self, image_paths: List[ImageSource], prompt: str) -> str:
+        """Analyze several images in a single request.
         
-        from openai import OpenAI
+        Only the OpenAI-compatible providers (llava, openai, azure) accept
+        several images per message.
         
-        base64_image = self._encode_image(image_path)
-        mime_type = self._get_mime_type(image_path)
+        Args:
+            image_paths: Paths to image files, or encoded image bytes
+            prompt: Analysis prompt covering all the images
+            
+        Returns:
+            Raw model response
+        """
+        if self.provider not in MULTI_IMAGE_PROVIDERS:
+            raise ValueError(f"Provider does not support multi-image requests: {self.provider}")
         
-        # Create HTTP client that disables SSL verification
-        http_client = httpx.Client(verify=False, timeout=60.0)
+        content = [{"type": "text", "text": prompt}]
+        content.extend(self._image_part(image_path) for image_path in image_paths)
+        messages = [{"role": "user", "content": content}]
         
-        # Use OpenAI client with custom base_url
-        client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url,
-            http_client=http_client
-        )
+        if self.provider == "llava":
+            return self._chat_llava(messages, max_tokens=1024 * len(image_paths))
+        
+        if self.provider == "azure":
+            from openai import AzureOpenAI
+            client = AzureOpenAI(
+                api_key=self.api_key,
+                api_version=os.getenv("AZURE_API_VERSION", "2024-12-01-preview"),
+                azure_endpoint=self.base_url,
+                max_retries=0
+            )
+            model = os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4o")
+        else:
+            from openai import OpenAI
+            client = OpenAI(api_key=self.api_key, max_retries=0)
+            model = "gpt-4o"
         
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=1024 * len(image_paths)
+        )
+        return response.choices[0].message.content
+    
+    def _analyze_with_llava(self, image_path: ImageSource, prompt: str) -> str:
+        """Analyze using Llava via ESPRIT TokenFactory."""
+        return self._chat_llava([
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    self._image_part(image_path)
+                ]
+            }
+        ])
+    
+    def _chat_llava(self, messages: list, max_tokens: int = 1024) -> str:
+        """Send a vision chat request to Llava via ESPRIT TokenFactory."""
         try:
-            response = client.chat.completions.create(
+            response = self._get_llava_openai().chat.completions.create(
                 model="hosted_vllm/llava-1.5-7b-hf",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:{mime_type};base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=1024,
+                messages=messages,
+                max_tokens=max_tokens,
                 temperature=0.2
             )
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"Llava API error: {e}")
             raise
-        finally:
-            http_client.close()
     
-    def _analyze_with_openai(self, image_path: str, prompt: str) -> str:
+    def _analyze_with_openai(self, image_path: ImageSource, prompt: str) -> str:
         """Analyze using OpenAI GPT-4 Vision."""
         from openai import OpenAI
         
-        client = OpenAI(api_key=self.api_key)
-        base64_image = self._encode_image(image_path)
-        mime_type = self._get_mime_type(image_path)
+        client = OpenAI(api_key=self.api_key, max_retries=0)
+        image_url = self._image_data_uri(image_path)
         
         response = client.chat.completions.create(
             model="gpt-4o",
@@ -160,7 +325,7 @@ class VisionClient:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:{mime_type};base64,{base64_image}"
+                                "url": image_url
                             }
                         },
                         {
@@ -175,18 +340,18 @@ class VisionClient:
         
         return response.choices[0].message.content
     
-    def _analyze_with_azure(self, image_path: str, prompt: str) -> str:
+    def _analyze_with_azure(self, image_path: ImageSource, prompt: str) -> str:
         """Analyze using Azure OpenAI."""
         from openai import AzureOpenAI
         
         client = AzureOpenAI(
             api_key=self.api_key,
             api_version=os.getenv("AZURE_API_VERSION", "2024-12-01-preview"),
-            azure_endpoint=self.base_url
+            azure_endpoint=self.base_url,
+            max_retries=0
         )
         
-        base64_image = self._encode_image(image_path)
-        mime_type = self._get_mime_type(image_path)
+        image_url = self._image_data_uri(image_path)
         
         response = client.chat.completions.create(
             model=os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4o"),
@@ -197,7 +362,7 @@ class VisionClient:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:{mime_type};base64,{base64_image}"
+                                "url": image_url
                             }
                         },
                         {
@@ -212,11 +377,11 @@ class VisionClient:
         
         return response.choices[0].message.content
     
-    def _analyze_with_anthropic(self, image_path: str, prompt: str) -> str:
+    def _analyze_with_anthropic(self, image_path: ImageSource, prompt: str) -> str:
         """Analyze using Anthropic Claude."""
         import anthropic
         
-        client = anthropic.Anthropic(api_key=self.api_key)
+        client = anthropic.Anthropic(api_key=self.api_key, max_retries=0)
         base64_image = self._encode_image(image_path)
         mime_type = self._get_mime_type(image_path)
         
@@ -246,15 +411,19 @@ class VisionClient:
         
         return response.content[0].text
     
-    def _analyze_with_google(self, image_path: str, prompt: str) -> str:
+    def _analyze_with_google(self, image_path: ImageSource, prompt: str) -> str:
         """Analyze using Google Gemini."""
         import google.generativeai as genai
-        from PIL import Image
         
         genai.configure(api_key=self.api_key)
         model = genai.GenerativeModel("gemini-1.5-flash")
         
-        image = Image.open(image_path)
+        # Send the encoded image as-is (a PIL image would be decoded, then re-encoded by the SDK)
+        if isinstance(image_path, bytes):
+            image_bytes = image_path
+        else:
+            image_bytes = bytes(_read_image_file(str(image_path), os.stat(image_path).st_size))
+        image = {"mime_type": self._get_mime_type(image_path), "data": image_bytes}
         response = model.generate_content([prompt, image])
         
         return response.text
@@ -281,8 +450,6 @@ class VisionClient:
     
     def _generate_text_llava(self, prompt: str, system_prompt: str = None) -> str:
         """Generate text using Llava/Llama."""
-        import httpx
-        
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
@@ -303,11 +470,69 @@ class VisionClient:
         url = f"{self.base_url}/v1/chat/completions"
         
         try:
-            with httpx.Client(timeout=120.0, verify=False) as client:
-                response = client.post(url, json=payload, headers=headers)
+            response = self._get_http().post(url, json=payload, headers=headers, timeout=120.0)
+            response.raise_for_status()
+            data = response.json()
+            return data["choices"][0]["message"]["content"]
+        except Exception as e:
+            logger.error(f"Text generation error: {e}")
+            raise
+    
+    def generate_text_stream(self, prompt: str, system_prompt: str = None) -> Iterator[str]:
+        """Generate text without image, yielding the answer as it arrives.
+        
+        Llava (also the text fallback for providers without their own text
+        path) streams server-sent chunks; OpenAI and Azure yield the whole
+        answer at once.
+        
+        Args:
+            prompt: User prompt
+            system_prompt: Optional system prompt
+            
+        Yields:
+            Successive pieces of the generated text
+        """
+        if self.provider in ("openai", "azure"):
+            yield self.generate_text(prompt, system_prompt)
+        else:
+            yield from self._generate_text_llava_stream(prompt, system_prompt)
+    
+    def _generate_text_llava_stream(self, prompt: str, system_prompt: str = None) -> Iterator[str]:
+        """Stream text from Llava/Llama through the OpenAI-compatible SSE endpoint."""
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        
+        payload = {
+            "model": "hosted_vllm/Llama-3.1-70B-Instruct",
+            "messages": messages,
+            "max_tokens": 4096,
+            "temperature": 0.3,
+            "stream": True
+        }
+        
+        url = f"{self.base_url}/v1/chat/completions"
+        
+        try:
+            with self._get_http().stream("POST", url, json=payload, headers=headers, timeout=120.0) as response:
                 response.raise_for_status()
-                data = response.json()
-                return data["choices"][0]["message"]["content"]
+                for line in response.iter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or ()
+                    for choice in choices:
+                        content = (choice.get("delta") or {}).get("content")
+                        if content:
+                            yield content
         except Exception as e:
             logger.error(f"Text generation error: {e}")
             raise
@@ -353,3 +578,14 @@ class VisionClient:
         )
         
         return response.choices[0].message.content
+
+
+@lru_cache(maxsize=8)
+def get_vision_client(provider: ProviderType = "llava") -> VisionClient:
+    """Return the shared VisionClient for a provider.
+    
+    Tools and analyzers reuse one client per provider instead of building a
+    new one (and re-reading its configuration) on every call. The client is
+    safe to share across threads.
+    """
+    return VisionClient(provider=provider)
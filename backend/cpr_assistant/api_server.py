@@ -14,8 +14,19 @@ from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 from dotenv import load_dotenv
 import threading
+import queue
+import time
+from bisect import bisect_right
+from collections import OrderedDict
 from datetime import datetime
 from flask_cors import CORS
+
+# SIMD base64 codec (optional, falls back to the standard library)
+try:
+    import pybase64 as b64codec
+except ImportError:
+    b64codec = base64
+
 # Import your existing CPR components from main.py
 # NOTE: main.py should NOT be running when using this API server
 try:
@@ -40,6 +51,34 @@ load_dotenv()
 # Configuration
 FLASK_PORT = int(os.getenv("API_SERVER_PORT", 5000))
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
+# Optimized YOLO format exported once next to MODEL_PATH ("engine" = TensorRT
+# FP16, "onnx"); empty keeps the PyTorch weights
+YOLO_EXPORT_FORMAT = os.getenv("CPR_YOLO_EXPORT_FORMAT", "").lower()
+YOLO_EXPORT_SUFFIXES = {"engine": ".engine", "onnx": ".onnx"}
+# Socket frames batched per YOLO call; the window is how long the worker
+# waits for more frames (0 = only frames already queued, no added latency)
+FRAME_BATCH_MAX = int(os.getenv("CPR_FRAME_BATCH_MAX", 8))
+FRAME_BATCH_WINDOW_MS = float(os.getenv("CPR_FRAME_BATCH_WINDOW_MS", 0))
+# Socket frames faster than this are dropped before decoding (pose metrics
+# gain nothing beyond ~15 FPS); 0 disables the decimation
+TARGET_FRAME_FPS = float(os.getenv("CPR_TARGET_FPS", 15))
+# VLM advice reused for technique states that round to the same buckets
+# (bucket width per score field); frames themselves never repeat exactly
+VLM_ADVICE_CACHE_SIZE = int(os.getenv("CPR_VLM_ADVICE_CACHE_SIZE", 256))
+VLM_ADVICE_BUCKETS = {
+    'overall': 5,
+    'arm_score': 5,
+    'hand_position_score': 5,
+    'depth_score': 5,
+    'rate_score': 5,
+    'recoil_score': 5,
+    'ratio_score': 5,
+    'rate_cpm': 5,
+    'depth_cm': 0.5
+}
+# Decode incoming frames at half resolution (keypoints are normalized, so
+# scores are unaffected; YOLO resizes to its input size anyway)
+FRAME_DECODE_FLAG = cv2.IMREAD_REDUCED_COLOR_2 if os.getenv("CPR_DECODE_HALF_RES", "0") == "1" else cv2.IMREAD_COLOR
 
 # Initialize Flask + SocketIO
 app = Flask(__name__)
@@ -56,14 +95,13 @@ class CPRSession:
         self.metronome = None
         self.logger = None
         self.frame_count = 0
-        self.last_feedback_time = 0
+        self.last_feedback_time = 0.0
         self.current_feedback = None
         
     def initialize(self):
         """Initialize CPR components"""
         try:
-            print(f"Loading YOLO model from {MODEL_PATH}...")
-            self.model = YOLO(MODEL_PATH)
+            self.model = self.load_model()
             self.metrics = ImprovedCPRMetrics()
             self.fatigue_detector = FatigueDetector()
             self.metronome = AudioMetronome(target_bpm=110)
@@ -78,6 +116,30 @@ class CPRSession:
             print(f"❌ Failed to initialize CPR session: {e}")
             return False
     
+    def load_model(self):
+        """Load YOLO, exporting it to YOLO_EXPORT_FORMAT on first use"""
+        suffix = YOLO_EXPORT_SUFFIXES.get(YOLO_EXPORT_FORMAT)
+        if suffix:
+            export_path = os.path.splitext(MODEL_PATH)[0] + suffix
+            try:
+                if not os.path.exists(export_path):
+                    print(f"Exporting YOLO model to {YOLO_EXPORT_FORMAT} (one-time)...")
+                    export_path = YOLO(MODEL_PATH).export(
+                        format=YOLO_EXPORT_FORMAT,
+                        half=YOLO_EXPORT_FORMAT == "engine",
+                        imgsz=640,
+                        # Dynamic batch so FrameBatcher batches still fit
+                        dynamic=True,
+                        batch=FRAME_BATCH_MAX
+                    )
+                print(f"Loading YOLO model from {export_path}...")
+                return YOLO(export_path, task="pose")
+            except Exception as e:
+                print(f"⚠️ YOLO {YOLO_EXPORT_FORMAT} export unavailable, using PyTorch weights: {e}")
+        
+        print(f"Loading YOLO model from {MODEL_PATH}...")
+        return YOLO(MODEL_PATH)
+    
     def reset(self):
         """Reset session"""
         self.metrics = ImprovedCPRMetrics()
@@ -87,6 +149,35 @@ class CPRSession:
 
 session = CPRSession()
 
+# Score cut-offs for the frontend's per-metric feedback (<70, 70-79, >=80)
+FEEDBACK_THRESHOLDS = (70, 80)
+FEEDBACK_LABELS = ('incorrect', 'neutral', 'correct')
+
+# Score fields sent to the frontend
+SCORE_RESPONSE_FIELDS = (
+    'overall', 'arm_score', 'arm_angle', 'hand_position_score', 'depth_score',
+    'depth_cm', 'rate_score', 'rate_cpm', 'recoil_score', 'compression_count'
+)
+
+def build_feedback(scores):
+    """Label depth, rate and hand position scores for the frontend"""
+    return {
+        'depth': FEEDBACK_LABELS[bisect_right(FEEDBACK_THRESHOLDS, scores['depth_score'])],
+        'rate': FEEDBACK_LABELS[bisect_right(FEEDBACK_THRESHOLDS, scores['rate_score'])],
+        'position': FEEDBACK_LABELS[bisect_right(FEEDBACK_THRESHOLDS, scores['hand_position_score'])]
+    }
+
+def decode_frame(frame_payload):
+    """Decode a JPEG frame (raw bytes or base64 data URI) to a BGR image, or None"""
+    if isinstance(frame_payload, (bytes, bytearray)):
+        # Binary socket frames arrive as the encoded image itself
+        frame_bytes = frame_payload
+    else:
+        # Skip a "data:image/jpeg;base64," prefix without splitting the payload
+        frame_data = frame_payload[frame_payload.find(',') + 1:]
+        frame_bytes = b64codec.b64decode(frame_data)
+    return cv2.imdecode(np.frombuffer(frame_bytes, dtype=np.uint8), FRAME_DECODE_FLAG)
+
 # ====================================================================
 # REST API ENDPOINTS
 # ====================================================================
@@ -188,6 +279,7 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
+    last_frame_times.pop(request.sid, None)
     print(f"🔌 Client disconnected: {request.sid}")
 
 @socketio.on('video_frame')
@@ -203,104 +295,26 @@ def handle_video_frame(data):
         emit('error', {'message': 'Session not active'})
         return
     
+    # Drop frames above the target rate, or while YOLO is a full batch behind
+    now = time.monotonic()
+    if TARGET_FRAME_FPS > 0 and now - last_frame_times.get(request.sid, 0.0) < 1 / TARGET_FRAME_FPS:
+        emit('cpr_skip', {'timestamp': data.get('timestamp'), 'reason': 'rate'})
+        return
+    if frame_batcher.busy():
+        emit('cpr_skip', {'timestamp': data.get('timestamp'), 'reason': 'busy'})
+        return
+    last_frame_times[request.sid] = now
+    
     try:
         # Decode base64 frame
-        frame_data = data.get('frame', '').split(',')[1] if ',' in data.get('frame', '') else data.get('frame', '')
-        frame_bytes = base64.b64decode(frame_data)
-        frame_array = np.frombuffer(frame_bytes, dtype=np.uint8)
-        frame = cv2.imdecode(frame_array, cv2.IMREAD_COLOR)
+        frame = decode_frame(data.get('frame', ''))
         
         if frame is None:
             emit('error', {'message': 'Invalid frame'})
             return
         
-        session.frame_count += 1
-        
-        # Run YOLO detection
-        results = session.model(frame, verbose=False)
-        
-        # Process results
-        response_data = {
-            'frame_number': session.frame_count,
-            'timestamp': data.get('timestamp'),
-            'detection': False,
-            'scores': None,
-            'feedback': None,
-            'fatigue_warning': None
-        }
-        
-        # Check if we have valid detections (rescuer + victim)
-        if (len(results) > 0 and 
-            len(results[0].keypoints.xyn) >= 2 and 
-            results[0].keypoints.xyn[0].shape[0] > 0):
-            
-            r = results[0]
-            rescuer_kps = r.keypoints.xyn[0].cpu().numpy()
-            victim_kps = r.keypoints.xyn[1].cpu().numpy()
-            
-            frame_height, frame_width = frame.shape[:2]
-            
-            # Calculate CPR scores using your existing metrics
-            scores = session.metrics.get_comprehensive_score(
-                rescuer_kps=rescuer_kps,
-                victim_kps=victim_kps,
-                scale_factor=(frame_width, frame_height)
-            )
-            
-            # Update fatigue detection
-            session.fatigue_detector.update(scores['overall'])
-            fatigue_warning = session.fatigue_detector.get_warning()
-            
-            # Get VLM feedback (every 10 seconds if score is low)
-            current_time = datetime.now().timestamp()
-            if current_time - session.last_feedback_time > 10 and scores['overall'] < 75:
-                # Request VLM advice in background thread
-                threading.Thread(
-                    target=get_vlm_feedback_async,
-                    args=(frame, scores),
-                    daemon=True
-                ).start()
-                session.last_feedback_time = current_time
-            
-            # Prepare response with all data
-            response_data.update({
-                'detection': True,
-                'scores': {
-                    'overall': scores['overall'],
-                    'arm_score': scores['arm_score'],
-                    'arm_angle': scores['arm_angle'],
-                    'hand_position_score': scores['hand_position_score'],
-                    'depth_score': scores['depth_score'],
-                    'depth_cm': scores['depth_cm'],
-                    'rate_score': scores['rate_score'],
-                    'rate_cpm': scores['rate_cpm'],
-                    'recoil_score': scores['recoil_score'],
-                    'compression_count': scores['compression_count']
-                },
-                'feedback': {
-                    'depth': 'correct' if scores['depth_score'] >= 80 else 'incorrect' if scores['depth_score'] < 70 else 'neutral',
-                    'rate': 'correct' if scores['rate_score'] >= 80 else 'incorrect' if scores['rate_score'] < 70 else 'neutral',
-                    'position': 'correct' if scores['hand_position_score'] >= 80 else 'incorrect' if scores['hand_position_score'] < 70 else 'neutral'
-                },
-                'vlm_advice': session.current_feedback,
-                'fatigue_warning': fatigue_warning,
-                'keypoints': {
-                    'rescuer': rescuer_kps.tolist(),
-                    'victim': victim_kps.tolist()
-                }
-            })
-            
-            # Log data every 10 frames
-            if session.frame_count % 10 == 0:
-                session.logger.log_frame(
-                    session.frame_count,
-                    scores,
-                    session.fatigue_detector.fatigue_level,
-                    session.current_feedback
-                )
-        
-        # Send response to frontend
-        emit('cpr_analysis', response_data)
+        # YOLO runs on the batching worker, which emits the analysis
+        frame_batcher.submit(request.sid, frame, data.get('timestamp'))
         
     except Exception as e:
         print(f"❌ Error processing frame: {e}")
@@ -308,11 +322,170 @@ def handle_video_frame(data):
         traceback.print_exc()
         emit('error', {'message': str(e)})
 
+def analyze_frame(frame, r, timestamp=None):
+    """Score one frame's YOLO result and build the analysis payload (socket and REST)"""
+    session.frame_count += 1
+    
+    # Process results
+    response_data = {
+        'frame_number': session.frame_count,
+        'timestamp': timestamp,
+        'detection': False,
+        'scores': None,
+        'feedback': None,
+        'fatigue_warning': None,
+        'vlm_advice': None
+    }
+    
+    # Check if we have valid detections (rescuer + victim)
+    if (len(r.keypoints.xyn) >= 2 and 
+        r.keypoints.xyn[0].shape[0] > 0):
+        
+        # One device-to-host copy for both people instead of one each
+        rescuer_kps, victim_kps = r.keypoints.xyn[:2].cpu().numpy()
+        
+        frame_height, frame_width = frame.shape[:2]
+        
+        # Calculate CPR scores using your existing metrics
+        scores = session.metrics.get_comprehensive_score(
+            rescuer_kps=rescuer_kps,
+            victim_kps=victim_kps,
+            scale_factor=(frame_width, frame_height)
+        )
+        
+        # Update fatigue detection
+        session.fatigue_detector.update(scores['overall'])
+        fatigue_warning = session.fatigue_detector.get_warning()
+        
+        # Get VLM feedback (every 10 seconds if score is low)
+        current_time = time.monotonic()
+        if current_time - session.last_feedback_time > 10 and scores['overall'] < 75:
+            # Request VLM advice in background thread
+            threading.Thread(
+                target=get_vlm_feedback_async,
+                args=(frame, scores),
+                daemon=True
+            ).start()
+            session.last_feedback_time = current_time
+        
+        # Prepare response with all data
+        response_data.update({
+            'detection': True,
+            'scores': {field: scores[field] for field in SCORE_RESPONSE_FIELDS},
+            'feedback': build_feedback(scores),
+            'vlm_advice': session.current_feedback,
+            'fatigue_warning': fatigue_warning,
+            'keypoints': {
+                'rescuer': rescuer_kps.tolist(),
+                'victim': victim_kps.tolist()
+            }
+        })
+        
+        # Log data every 10 frames
+        if session.frame_count % 10 == 0:
+            session.logger.log_frame(
+                session.frame_count,
+                scores,
+                session.fatigue_detector.fatigue_level,
+                session.current_feedback
+            )
+    
+    return response_data
+
+class FrameBatcher:
+    """
+    Collects socket frames on a queue and runs YOLO on them in batches
+    A single worker thread also keeps frames scored in arrival order
+    """
+    def __init__(self, max_batch=FRAME_BATCH_MAX, window_s=FRAME_BATCH_WINDOW_MS / 1000):
+        self.max_batch = max_batch
+        self.window_s = window_s
+        self.queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+    
+    def submit(self, sid, frame, timestamp):
+        """Queue a decoded frame for analysis"""
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+        self.queue.put((sid, frame, timestamp))
+    
+    def busy(self):
+        """Whether a full batch is already waiting for the worker"""
+        return self.queue.qsize() >= self.max_batch
+    
+    def _drain(self):
+        """Wait for one frame, then take up to max_batch within the window"""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window_s
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._drain()
+            if not session.active or not session.model:
+                continue
+            try:
+                results = session.model([frame for _, frame, _ in batch], verbose=False)
+                for (sid, frame, timestamp), r in zip(batch, results):
+                    socketio.emit('cpr_analysis', analyze_frame(frame, r, timestamp), room=sid)
+            except Exception as e:
+                print(f"❌ Error processing frame batch: {e}")
+                import traceback
+                traceback.print_exc()
+                for sid in {sid for sid, _, _ in batch}:
+                    socketio.emit('error', {'message': str(e)}, room=sid)
+
+frame_batcher = FrameBatcher()
+# Monotonic arrival time of the last accepted frame, per socket
+last_frame_times = {}
+
+@socketio.on('video_frame_bin')
+def handle_video_frame_bin(data):
+    """
+    Process a binary video frame from frontend (no base64 on either side)
+    Expected data format: {
+        "frame": ArrayBuffer of the JPEG image,
+        "timestamp": timestamp
+    }
+    """
+    handle_video_frame(data)
+
+vlm_advice_cache = OrderedDict()
+vlm_advice_lock = threading.Lock()
+
+def advice_cache_key(scores):
+    """Scores quantized to VLM_ADVICE_BUCKETS, so near-identical states share advice"""
+    return tuple(
+        round(scores.get(field, 0) / width) * width
+        for field, width in VLM_ADVICE_BUCKETS.items()
+    )
+
 def get_vlm_feedback_async(frame, scores):
     """Get VLM feedback in background thread"""
     try:
-        # Try to get VLM advice using function from main.py
-        advice = get_expert_advice(frame, scores)
+        key = advice_cache_key(scores)
+        with vlm_advice_lock:
+            advice = vlm_advice_cache.get(key)
+            if advice:
+                vlm_advice_cache.move_to_end(key)
+        
+        if not advice:
+            # Try to get VLM advice using function from main.py
+            advice = get_expert_advice(frame, scores)
+            if advice:
+                with vlm_advice_lock:
+                    vlm_advice_cache[key] = advice
+                    if len(vlm_advice_cache) > VLM_ADVICE_CACHE_SIZE:
+                        vlm_advice_cache.popitem(last=False)
         
         if not advice:
             # Use fallback from main.py
@@ -323,7 +496,7 @@ def get_vlm_feedback_async(frame, scores):
         # Emit to all connected clients
         socketio.emit('vlm_feedback', {
             'advice': advice,
-            'timestamp': datetime.now().timestamp()
+            'timestamp': time.time()
         })
         
         print(f"💡 VLM Advice: {advice}")
@@ -338,77 +511,14 @@ def process_frame():
     
     try:
         data = request.get_json()
-        frame_data = data.get('frame', '').split(',')[1] if ',' in data.get('frame', '') else data.get('frame', '')
-        frame_bytes = base64.b64decode(frame_data)
-        frame_array = np.frombuffer(frame_bytes, dtype=np.uint8)
-        frame = cv2.imdecode(frame_array, cv2.IMREAD_COLOR)
+        frame = decode_frame(data.get('frame', ''))
         
         if frame is None:
             return jsonify({'error': 'Invalid frame'}), 400
         
-        session.frame_count += 1
-        
         # Run YOLO detection
         results = session.model(frame, verbose=False)
-        
-        response_data = {
-            'detection': False,
-            'scores': None,
-            'feedback': None,
-            'fatigue_warning': None,
-            'vlm_advice': None
-        }
-        
-        if (len(results) > 0 and 
-            len(results[0].keypoints.xyn) >= 2 and 
-            results[0].keypoints.xyn[0].shape[0] > 0):
-            
-            r = results[0]
-            rescuer_kps = r.keypoints.xyn[0].cpu().numpy()
-            victim_kps = r.keypoints.xyn[1].cpu().numpy()
-            
-            frame_height, frame_width = frame.shape[:2]
-            
-            scores = session.metrics.get_comprehensive_score(
-                rescuer_kps=rescuer_kps,
-                victim_kps=victim_kps,
-                scale_factor=(frame_width, frame_height)
-            )
-            
-            session.fatigue_detector.update(scores['overall'])
-            fatigue_warning = session.fatigue_detector.get_warning()
-            
-            current_time = datetime.now().timestamp()
-            if current_time - session.last_feedback_time > 10 and scores['overall'] < 75:
-                threading.Thread(
-                    target=get_vlm_feedback_async,
-                    args=(frame, scores),
-                    daemon=True
-                ).start()
-                session.last_feedback_time = current_time
-            
-            response_data.update({
-                'detection': True,
-                'scores': {
-                    'overall': scores['overall'],
-                    'arm_score': scores['arm_score'],
-                    'arm_angle': scores['arm_angle'],
-                    'hand_position_score': scores['hand_position_score'],
-                    'depth_score': scores['depth_score'],
-                    'depth_cm': scores['depth_cm'],
-                    'rate_score': scores['rate_score'],
-                    'rate_cpm': scores['rate_cpm'],
-                    'recoil_score': scores['recoil_score'],
-                    'compression_count': scores['compression_count']
-                },
-                'feedback': {
-                    'depth': 'correct' if scores['depth_score'] >= 80 else 'incorrect' if scores['depth_score'] < 70 else 'neutral',
-                    'rate': 'correct' if scores['rate_score'] >= 80 else 'incorrect' if scores['rate_score'] < 70 else 'neutral',
-                    'position': 'correct' if scores['hand_position_score'] >= 80 else 'incorrect' if scores['hand_position_score'] < 70 else 'neutral'
-                },
-                'vlm_advice': session.current_feedback,
-                'fatigue_warning': fatigue_warning
-            })
+        response_data = analyze_frame(frame, results[0], data.get('timestamp'))
         
         return jsonify(response_data), 200
         
@@ -423,12 +533,12 @@ def handle_manual_feedback_request():
     if session.current_feedback:
         emit('vlm_feedback', {
             'advice': session.current_feedback,
-            'timestamp': datetime.now().timestamp()
+            'timestamp': time.time()
         })
     else:
         emit('vlm_feedback', {
             'advice': "Maintenez une bonne technique CPR",
-            'timestamp': datetime.now().timestamp()
+            'timestamp': time.time()
         })
 
 @socketio.on('toggle_metronome')
@@ -327,11 +327,21 @@ export default function CPRCameraPage() {
       canvas.height = video.videoHeight
       ctx.drawImage(video, 0, 0, canvas.width, canvas.height)
 
-      const frameData = canvas.toDataURL('image/jpeg', 0.8)
-      socketRef.current.emit('video_frame', {
-        frame: frameData,
-        timestamp: Date.now()
-      })
+      const timestamp = Date.now()
+      // Send the JPEG as binary (no base64 data URI to encode and decode)
+      canvas.toBlob((blob) => {
+        if (!blob || !socketRef.current) {
+          return
+        }
+        blob.arrayBuffer()
+          .then((buffer) => {
+            socketRef.current?.emit('video_frame_bin', {
+              frame: buffer,
+              timestamp
+            })
+          })
+          .catch((err: any) => addLog('❌ Frame capture error: ' + err.message))
+      }, 'image/jpeg', 0.8)
     } catch (err: any) {
       addLog('❌ Frame capture error: ' + err.message)
     }